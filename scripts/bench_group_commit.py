@@ -0,0 +1,80 @@
+# Measures PUT throughput and latency of group commit across group windows, with the write-ahead log
+# syncing every commit, so each group costs one fsync
+# Usage: python3 bench_group_commit.py [num_writes] [threads]   (defaults to 5000 writes, 32 threads)
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from util.kvs import KVS
+from util.commit import GroupCommit
+from util.persistence import Persistence
+
+# (max size, max delay in seconds) of each run, size 1 commits every PUT on its own
+WINDOWS = [(1, 0), (64, 0), (64, 0.0005), (64, 0.001), (64, 0.002), (64, 0.005)]
+
+
+def percentile(latencies: list, p: float) -> float:
+    return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+
+def bench(max_size: int, max_delay: float, num_writes: int, threads: int) -> tuple:
+    directory = tempfile.mkdtemp(prefix="bench-group-commit-")
+    try:
+        kvs = KVS()
+        kvs.log = Persistence(directory, fsync_policy="always")
+        commits = GroupCommit(kvs.upsert_many, max_size=max_size, max_delay=max_delay)
+        latencies = []
+
+        def writer(offset: int):
+            own = []
+            for i in range(offset, num_writes, threads):
+                start = time.perf_counter()
+                commits.submit((f"key{i % 5000}", f"value{i}", []))
+                own.append(time.perf_counter() - start)
+            latencies.extend(own)
+
+        workers = [threading.Thread(target=writer, args=(t,)) for t in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        kvs.log.close()
+        latencies.sort()
+        return (
+            num_writes / elapsed,
+            percentile(latencies, 0.5),
+            percentile(latencies, 0.99),
+            commits.stats()["average-size"],
+        )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    num_writes = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    results = [
+        (max_size, max_delay, *bench(max_size, max_delay, num_writes, threads))
+        for max_size, max_delay in WINDOWS
+    ]
+    best = max(throughput for _, _, throughput, *_ in results)
+    print(
+        f"{'size':>4} {'delay ms':>8} {'writes/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'group':>6}"
+    )
+    for max_size, max_delay, throughput, p50, p99, group in results:
+        # throughput relative to the best window
+        bar = "#" * round(40 * throughput / best)
+        print(
+            f"{max_size:>4} {max_delay * 1000:>8.1f} {throughput:>10.0f} "
+            f"{p50 * 1000:>8.2f} {p99 * 1000:>8.2f} {group:>6.1f}  {bar}"
+        )
@@ -0,0 +1,46 @@
+# Compares the legacy linear bucket scan against RangePlacement, verifying identical placement
+# Usage: python3 bench_key_assignment.py [num_keys] [num_buckets ...]   (defaults to 1000000 1 10 100 1000)
+
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from util.placement import RangePlacement, key_hash
+
+
+def legacy_assign(hashed: int, num_buckets: int) -> int:
+    p = hashed / float(2**128)
+    for bucket_index in range(0, num_buckets):
+        if (
+            bucket_index / float(num_buckets) <= p
+            and (bucket_index + 1) / float(num_buckets) > p
+        ):
+            return bucket_index
+    return num_buckets - 1
+
+
+num_keys = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+bucket_counts = [int(arg) for arg in sys.argv[2:]] or [1, 10, 100, 1000]
+hashes = [key_hash(f"key{index}") for index in range(num_keys)]
+
+print(
+    f"{'buckets':>8} {'legacy s':>10} {'range s':>10} {'speedup':>8} {'identical':>10}"
+)
+for num_buckets in bucket_counts:
+    start = time.perf_counter()
+    legacy = [legacy_assign(hashed, num_buckets) for hashed in hashes]
+    legacy_elapsed = time.perf_counter() - start
+
+    placement = RangePlacement(num_buckets)
+    start = time.perf_counter()
+    ranged = [placement.assign(hashed) for hashed in hashes]
+    range_elapsed = time.perf_counter() - start
+
+    print(
+        f"{num_buckets:>8} {legacy_elapsed:>10.3f} {range_elapsed:>10.3f} "
+        f"{legacy_elapsed / range_elapsed:>8.1f} {str(legacy == ranged):>10}"
+    )
@@ -0,0 +1,63 @@
+# Reports KVS memory per key for slotted KVSItems against the previous __dict__ based items
+# Usage: python3 bench_memory.py [num_keys]   (defaults to 1000000)
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from util.kvs import KVS, KVSItem
+
+
+class DictItem:
+    """Previous KVSItem layout: four fields and a sequence number in an instance __dict__"""
+
+    def __init__(self, value, cause):
+        self.__dict__.update(
+            {
+                "value": value,
+                "last-write": time.time(),
+                "cause": cause,
+                "deleted": False,
+            }
+        )
+        self.seq = 0
+
+
+def bytes_per_key(build, num_keys: int) -> float:
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    store = build(num_keys)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    return (after - before) / num_keys
+
+
+def build_dict_items(num_keys: int) -> dict:
+    return {f"key{index}": DictItem(f"v{index}", []) for index in range(num_keys)}
+
+
+def build_slotted_items(num_keys: int) -> dict:
+    return {f"key{index}": KVSItem(f"v{index}") for index in range(num_keys)}
+
+
+def build_kvs(num_keys: int) -> KVS:
+    kvs = KVS()
+    for index in range(num_keys):
+        kvs.upsert(f"key{index}", f"v{index}")
+    return kvs
+
+
+num_keys = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+print(f"{'layout':>22} {'bytes/key':>10}")
+for name, build in [
+    ("dict items (before)", build_dict_items),
+    ("slotted items (after)", build_slotted_items),
+    ("full KVS (after)", build_kvs),
+]:
+    print(f"{name:>22} {bytes_per_key(build, num_keys):>10.1f}")
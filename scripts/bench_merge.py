@@ -0,0 +1,56 @@
+# Compares gossip merge cost of the JSON round-trip path against in-place KVS.merge
+# Usage: python3 bench_merge.py [num_keys ...]   (defaults to 10000 100000 1000000)
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from util.kvs import KVS
+
+
+def build_shards(num_keys: int, changed_ratio: float = 0.01):
+    local = KVS()
+    for index in range(num_keys):
+        local.upsert(f"key{index}", f"value{index}")
+    incoming = local.json()
+    # a gossip message where a small fraction of keys were written by the peer since
+    for index in range(0, num_keys, int(1 / changed_ratio)):
+        entry = dict(incoming[f"key{index}"])
+        entry["last-write"] += 1
+        entry["value"] = "updated"
+        incoming[f"key{index}"] = entry
+    return local, incoming
+
+
+def merge_round_trip(local: KVS, incoming: dict):
+    combined = KVS.combine_conflicting_shards(local.json(), incoming)
+    return KVS.from_shard(combined)
+
+
+def merge_in_place(local: KVS, incoming: dict):
+    local.merge(incoming)
+    return local
+
+
+def measure(merge, num_keys: int) -> tuple:
+    local, incoming = build_shards(num_keys)
+    tracemalloc.start()
+    start = time.perf_counter()
+    merge(local, incoming)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+print(f"{'keys':>10} {'method':>12} {'seconds':>10} {'peak MB':>10}")
+for num_keys in sizes:
+    for name, merge in [("round-trip", merge_round_trip), ("in-place", merge_in_place)]:
+        elapsed, peak = measure(merge, num_keys)
+        print(f"{num_keys:>10} {name:>12} {elapsed:>10.3f} {peak / 2 ** 20:>10.1f}")
@@ -0,0 +1,59 @@
+# Measures KVS write throughput with the write-ahead log under each fsync policy, and recovery time
+# Usage: python3 bench_wal.py [num_writes] [threads]   (defaults to 20000 writes, 8 threads)
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from util.kvs import KVS
+from util.persistence import Persistence
+
+
+def write(kvs: KVS, num_writes: int, threads: int) -> float:
+    def writer(offset: int):
+        for i in range(offset, num_writes, threads):
+            kvs.upsert(f"key{i % 5000}", f"value{i}")
+
+    workers = [threading.Thread(target=writer, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def bench(policy: str, num_writes: int, threads: int):
+    directory = tempfile.mkdtemp(prefix="bench-wal-")
+    try:
+        kvs = KVS()
+        if policy:
+            kvs.log = Persistence(directory, fsync_policy=policy)
+        elapsed = write(kvs, num_writes, threads)
+        label = policy or "none (memory only)"
+        print(f"{label:<20} {num_writes / elapsed:>10.0f} writes/s")
+        if policy:
+            kvs.log.snapshot(kvs)
+            write(kvs, num_writes // 10, threads)
+            kvs.log.close()
+            start = time.perf_counter()
+            records = Persistence(directory).load(KVS())
+            print(
+                f"{'':<20} recovered {records} records in {time.perf_counter() - start:.3f}s"
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    num_writes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    for policy in (None, "interval", "batch", "always"):
+        bench(policy, num_writes, threads)
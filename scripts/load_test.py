@@ -0,0 +1,46 @@
+# Measures requests/sec of a node under concurrent PUT/GET load
+# Start the node with SERVER=debug or SERVER=production and compare
+# Usage: python3 load_test.py [url] [threads] [requests_per_thread]
+
+import sys
+import time
+import threading
+import requests
+
+URI = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:13800/kvs/keys"
+THREADS = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+REQUESTS = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+latencies = []
+errors = []
+
+
+def worker(thread_index: int):
+    session = requests.Session()
+    headers = {"Content-Type": "application/json"}
+    for index in range(REQUESTS):
+        url = f"{URI}/load_{thread_index}_{index % 50}"
+        start = time.perf_counter()
+        if index % 2:
+            response = session.get(url, headers=headers, json={})
+        else:
+            response = session.put(url, headers=headers, json={"value": index})
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 500:
+            errors.append(response.status_code)
+
+
+threads = [threading.Thread(target=worker, args=(index,)) for index in range(THREADS)]
+start = time.perf_counter()
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+elapsed = time.perf_counter() - start
+
+latencies.sort()
+print(f"requests:    {len(latencies)}")
+print(f"errors:      {len(errors)}")
+print(f"requests/s:  {len(latencies) / elapsed:.1f}")
+print(f"p50 latency: {latencies[len(latencies) // 2] * 1000:.1f} ms")
+print(f"p99 latency: {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
@@ -33,5 +33,18 @@ def send_key_value(key, value):
         print(response.json())
 
 
-for index, key in enumerate(generate_keys()):
-    send_key_value(key, index)
+def send_key_values(pairs, batch_size: int = 1000):
+    # one request per batch_size keys, see /kvs/batch
+    url = URI.rsplit("/", 1)[0] + "/batch"
+    for start in range(0, len(pairs), batch_size):
+        operations = [
+            {"op": "PUT", "key": key, "value": value}
+            for key, value in pairs[start : start + batch_size]
+        ]
+        response = requests.put(url, json={"operations": operations})
+        for result in response.json().get("results", []):
+            if result["status-code"] > 201:
+                print(result)
+
+
+send_key_values([(key, index) for index, key in enumerate(generate_keys())])
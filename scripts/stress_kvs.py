@@ -0,0 +1,89 @@
+# Hammers a distributor with concurrent PUTs while gossip merges run, then checks no write was lost
+# Usage: python3 stress_kvs.py [writer_threads] [writes_per_thread]
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from util.kvs import KVS
+from util.distributor import KVSDistributor
+
+WRITERS = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+WRITES = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+# single node view, so every key is local and no gossip job is scheduled
+distributor = KVSDistributor(["127.0.0.1:13800"], "127.0.0.1:13800", 1)
+
+# gossip from a replica holding older versions of every key, and some keys of its own
+stale = KVS()
+for writer in range(WRITERS):
+    for index in range(WRITES):
+        stale.upsert(f"{writer}_{index}", "stale")
+for index in range(WRITES):
+    stale.upsert(f"peer_{index}", "peer")
+stale_items = list(stale.json().items())
+# gossip arrives as many small messages
+stale_shards = [
+    dict(stale_items[index : index + 500]) for index in range(0, len(stale_items), 500)
+]
+
+done = threading.Event()
+merges = 0
+
+
+def gossip():
+    global merges
+    while not done.is_set():
+        distributor.merge_gossip(stale_shards[merges % len(stale_shards)])
+        merges += 1
+
+
+def writer(writer_index: int):
+    for index in range(WRITES):
+        key = f"{writer_index}_{index}"
+        distributor.put(key, "first", [])
+        distributor.put(key, f"final_{index}", [])
+
+
+gossip_thread = threading.Thread(target=gossip)
+writers = [threading.Thread(target=writer, args=(index,)) for index in range(WRITERS)]
+start = time.perf_counter()
+gossip_thread.start()
+for thread in writers:
+    thread.start()
+for thread in writers:
+    thread.join()
+done.set()
+gossip_thread.join()
+elapsed = time.perf_counter() - start
+# later gossip rounds deliver whatever was not merged yet
+for shard in stale_shards:
+    distributor.merge_gossip(shard)
+
+lost = [
+    f"{writer}_{index}"
+    for writer in range(WRITERS)
+    for index in range(WRITES)
+    if distributor.kvs.get(f"{writer}_{index}", return_value=True) != f"final_{index}"
+]
+missing_peer = [
+    index
+    for index in range(WRITES)
+    if distributor.kvs.get(f"peer_{index}", return_value=True) != "peer"
+]
+digest_ok = (
+    distributor.kvs.digest.leaves
+    == KVS.from_shard(distributor.kvs.json()).digest.leaves
+)
+print(
+    f"writes: {WRITERS * WRITES * 2}, gossip merges: {merges}, seconds: {elapsed:.2f}"
+)
+print(
+    f"lost writes: {len(lost)}, missing gossiped keys: {len(missing_peer)}, digest consistent: {digest_ok}"
+)
+sys.exit(1 if lost or missing_peer or not digest_ok else 0)
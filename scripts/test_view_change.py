@@ -0,0 +1,78 @@
+#! /usr/bin/python3
+# Run against two_nodes_for_view_change.sh: node1 at localhost:13801, node2 at localhost:13802
+import unittest
+import requests
+
+node1 = "10.10.0.4:13800"
+node2 = "10.10.0.5:13800"
+
+num_keys = 50
+
+
+class view_change_test(unittest.TestCase):
+    def put_request(self, port, key, val, context):
+        return requests.put(
+            "http://localhost:%s/kvs/keys/%s" % (port, key),
+            json={"value": val, "causal-context": context},
+            headers={"Content-Type": "application/json"},
+        )
+
+    def get_request(self, port, key, context):
+        return requests.get(
+            "http://localhost:%s/kvs/keys/%s" % (port, key),
+            json={"causal-context": context},
+            headers={"Content-Type": "application/json"},
+        )
+
+    def view_change(self, port, view, repl_factor):
+        return requests.put(
+            "http://localhost:%s/kvs/view-change" % (port),
+            json={"view": ",".join(view), "repl-factor": repl_factor},
+            headers={"Content-Type": "application/json"},
+        )
+
+    def put_keys(self, port, prefix):
+        context = []
+        for i in range(num_keys):
+            response = self.put_request(port, "%s%d" % (prefix, i), str(i), context)
+            self.assertTrue(200 <= response.status_code <= 201)
+            context = response.json()["causal-context"]
+
+    def assert_keys(self, port, prefix):
+        for i in range(num_keys):
+            response = self.get_request(port, "%s%d" % (prefix, i), [])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["value"], str(i))
+
+    def key_total(self, response):
+        return sum(shard["key-count"] for shard in response.json()["shards"])
+
+    def test_repl_factor_shrink(self):
+        response = self.view_change("13801", [node1, node2], 2)
+        self.assertEqual(response.status_code, 200)
+        # keys left by earlier tests
+        total = self.key_total(response)
+        # written right before the view change, replica may not have them yet
+        self.put_keys("13801", "shrink")
+
+        response = self.view_change("13801", [node1, node2], 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.key_total(response), total + num_keys)
+        self.assert_keys("13801", "shrink")
+        self.assert_keys("13802", "shrink")
+
+    def test_node_leaves(self):
+        response = self.view_change("13801", [node1, node2], 2)
+        self.assertEqual(response.status_code, 200)
+        total = self.key_total(response)
+        self.put_keys("13801", "leave")
+
+        # node1 leaves, its replica must end up with every key
+        response = self.view_change("13801", [node2], 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.key_total(response), total + num_keys)
+        self.assert_keys("13802", "leave")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,2 +1,83 @@
+import os
+
 HOST = "0.0.0.0"
-PORT = 13800
\ No newline at end of file
+PORT = 13800
+
+# gossip strategy between replicas: "delta" sends only entries written since a peer's last ack,
+# "merkle" compares shard digests first and only transfers differing key ranges,
+# "full" sends the entire shard every round
+GOSSIP_MODE = os.getenv("GOSSIP_MODE", "delta")
+# number of levels in each shard's digest tree (2 ** MERKLE_DEPTH leaves), must match across nodes
+MERKLE_DEPTH = int(os.getenv("MERKLE_DEPTH", 10))
+# levels descended per digest round trip when replicas' digests differ
+MERKLE_STEP = int(os.getenv("MERKLE_STEP", 4))
+# maximum number of memoized key -> bucket assignments kept for the current view
+KEY_BUCKET_CACHE_SIZE = int(os.getenv("KEY_BUCKET_CACHE_SIZE", 100000))
+# seconds a key count of another shard, exchanged in the background, is used before asking the shard again
+KEY_COUNT_TTL = float(os.getenv("KEY_COUNT_TTL", 15))
+# maximum number of foreign keys whose latest seen write is remembered for causal checks,
+# least recently used keys are evicted first
+REMOTE_MARKS_CACHE_SIZE = int(os.getenv("REMOTE_MARKS_CACHE_SIZE", 100000))
+# maximum number of foreign keys whose latest value seen by this node is cached for reads at level ONE,
+# and seconds a cached value is served before the key's bucket is asked again
+FOREIGN_CACHE_SIZE = int(os.getenv("FOREIGN_CACHE_SIZE", 10000))
+FOREIGN_CACHE_TTL = float(os.getenv("FOREIGN_CACHE_TTL", 1))
+# key placement strategy: "range" splits the hash space evenly between buckets,
+# "ring" uses consistent hashing so view changes move about 1 / num_buckets of keys
+PLACEMENT = os.getenv("PLACEMENT", "range")
+# points each bucket owns on the consistent hashing ring
+RING_VNODES = int(os.getenv("RING_VNODES", 128))
+# seconds between purges of deleted entries every replica of the bucket is known to hold
+TOMBSTONE_GC_INTERVAL = float(os.getenv("TOMBSTONE_GC_INTERVAL", 30))
+# seconds a client request waits overall for the peers it asks in parallel, answering with the
+# responses it has once passed, so a slow peer cannot hold it for a whole request timeout
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", 2))
+# seconds to wait for a node to finish its part of a view change
+VIEW_CHANGE_TIMEOUT = float(os.getenv("VIEW_CHANGE_TIMEOUT", 60))
+# number of keys sent per request when moving keys between buckets during a view change
+RESHARD_CHUNK_SIZE = int(os.getenv("RESHARD_CHUNK_SIZE", 1000))
+# replicas of a key's bucket that must answer a read, or store a write, before it returns:
+# "ONE", "QUORUM" (a majority) or "ALL", overridable per request
+READ_CONSISTENCY = os.getenv("READ_CONSISTENCY", "ONE")
+WRITE_CONSISTENCY = os.getenv("WRITE_CONSISTENCY", "ONE")
+# seconds between pushes of writes to the other replicas of a bucket, 0 leaves replication to gossip
+REPLICATION_INTERVAL = float(os.getenv("REPLICATION_INTERVAL", 0))
+# concurrent local PUTs committed together, with one write-ahead log append and one replication
+# message, at most GROUP_COMMIT_SIZE per group (1 disables grouping). A group's first PUT waits up
+# to GROUP_COMMIT_DELAY seconds for others, PUTs arriving while a group commits form the next one.
+GROUP_COMMIT_SIZE = int(os.getenv("GROUP_COMMIT_SIZE", 64))
+GROUP_COMMIT_DELAY = float(os.getenv("GROUP_COMMIT_DELAY", 0))
+# seconds to wait for another bucket to apply its part of a batch
+BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT", 30))
+# entries per chunk when streaming a shard export or import
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 1000))
+# threads shared by all concurrent requests to other nodes
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", 32))
+# kept-alive connections pooled per peer
+POOL_MAXSIZE = int(os.getenv("POOL_MAXSIZE", 16))
+# seconds to wait for a connection to a peer, kept short so a partitioned replica is skipped quickly
+REQUEST_CONNECT_TIMEOUT = float(os.getenv("REQUEST_CONNECT_TIMEOUT", 0.5))
+# retries of requests whose connection was refused, with exponential backoff starting at REQUEST_BACKOFF seconds
+REQUEST_RETRIES = int(os.getenv("REQUEST_RETRIES", 2))
+REQUEST_BACKOFF = float(os.getenv("REQUEST_BACKOFF", 0.1))
+# "production" serves requests with a multi-threaded waitress server, "debug" with Flask's development server
+SERVER = os.getenv("SERVER", "debug")
+# request handling threads of the production server
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", 16))
+# locks striped over keys to serialize concurrent writes to the same key
+KVS_LOCK_STRIPES = int(os.getenv("KVS_LOCK_STRIPES", 64))
+# directory holding the write-ahead log and snapshots of the KVS, unset keeps data in memory only
+DATA_DIR = os.getenv("DATA_DIR")
+# when the write-ahead log is synced to disk: "always" on every write, "batch" every FSYNC_BATCH_SIZE
+# writes, "interval" at most every FSYNC_INTERVAL seconds
+FSYNC_POLICY = os.getenv("FSYNC_POLICY", "batch")
+FSYNC_BATCH_SIZE = int(os.getenv("FSYNC_BATCH_SIZE", 100))
+FSYNC_INTERVAL = float(os.getenv("FSYNC_INTERVAL", 1))
+# seconds between snapshots, which compact the write-ahead log
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", 60))
+# seconds before the latest restored write from which a restarted node catches up with a replica,
+# covering clock skew between replicas
+CATCH_UP_MARGIN = float(os.getenv("CATCH_UP_MARGIN", 5))
+# seconds a timestamp from a client or peer may be ahead of the local wall clock, later ones are
+# rejected or clamped so a single bogus timestamp cannot push the clock arbitrarily far ahead
+MAX_CLOCK_DRIFT = float(os.getenv("MAX_CLOCK_DRIFT", 60))
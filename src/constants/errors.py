@@ -2,3 +2,8 @@ UNABLE_TO_SATISFY = "Unable to satisfy request"
 KEY_TOO_LONG = "Key is too long"
 KEY_NOT_EXIST = "Key does not exist"
 VALUE_MISSING = "Value is missing"
+INVALID_OPERATION = "Operation is invalid"
+INVALID_VIEW = "View or replication factor is invalid"
+INVALID_CONSISTENCY = "Consistency level is invalid"
+CONSISTENCY_UNREACHABLE = "Unable to reach consistency level"
+INVALID_CONTEXT = "Causal context is invalid"
@@ -1,6 +1,20 @@
 import typing
 import requests
 from util.misc import status_code_success
+from constants.terms import (
+    INSTANCE,
+    KVS_TERM,
+    RESULTS,
+    CAUSAL_CONTEXT,
+    IMPORTED,
+    MERGED,
+)
+from constants.errors import (
+    INVALID_CONSISTENCY,
+    INVALID_CONTEXT,
+    INVALID_OPERATION,
+    INVALID_VIEW,
+)
 
 
 def success_response(msg: str = "Success") -> tuple:
@@ -62,6 +76,119 @@ def single_shard_info_response(count: int, shard_id: int, replicas: list) -> tup
     }
 
 
+def gossip_response(instance_id: str) -> tuple:
+    """Response from call to /kvs/gossip, acknowledging the absorbed entries
+
+    Args:
+        instance_id (str): ID of the acknowledging node's process
+
+    Returns:
+        tuple: json, status code
+    """
+    return {"message": "Gossip absorbed successfully", INSTANCE: instance_id}, 200
+
+
+def catch_up_response(shard: dict) -> tuple:
+    """Response from call to /kvs/catch-up
+
+    Args:
+        shard (dict): JSON serialized entries written since requested timestamp
+
+    Returns:
+        tuple: json, status code
+    """
+    return {"message": "Catch up retrieved successfully", KVS_TERM: shard}, 200
+
+
+def entries_response(shard: dict) -> tuple:
+    """Response from call to /kvs/entries
+
+    Args:
+        shard (dict): entries requested, including deleted ones
+
+    Returns:
+        tuple: json, status code
+    """
+    return {"message": "Entries retrieved successfully", KVS_TERM: shard}, 200
+
+
+def timestamps_response(timestamps: dict) -> tuple:
+    """Response from call to /kvs/timestamps
+
+    Args:
+        timestamps (dict): last write timestamps of requested keys, and horizon of node
+
+    Returns:
+        tuple: json, status code
+    """
+    return {"message": "Timestamps retrieved successfully", **timestamps}, 200
+
+
+def batch_response(results: list, context: list) -> tuple:
+    """Response from call to /kvs/batch
+
+    Args:
+        results (list): result of each operation, in order of operations
+        context (list): causal context following all operations
+
+    Returns:
+        tuple: json, status code
+    """
+    return {
+        "message": "Batch completed",
+        RESULTS: results,
+        CAUSAL_CONTEXT: context,
+    }, 200
+
+
+def shard_response(merged: int) -> tuple:
+    """Response from call to /kvs/shard
+
+    Args:
+        merged (int): number of entries written
+
+    Returns:
+        tuple: json, status code
+    """
+    return {"message": "Success", MERGED: merged}, 200
+
+
+def invalid_batch_response() -> tuple:
+    """Response to a batch whose operations are not a list of objects
+
+    Returns:
+        tuple: json, status code
+    """
+    return {"message": "Error in batch", "error": INVALID_OPERATION}, 400
+
+
+def import_response(imported: int, error: str = None) -> tuple:
+    """Response from call to /kvs/import
+
+    Args:
+        imported (int): number of entries imported
+        error (str, optional): reason import stopped early. Defaults to None.
+
+    Returns:
+        tuple: json, status code
+    """
+    if error:
+        return {"message": "Error in import", "error": error, IMPORTED: imported}, 400
+    return {"message": "Import successful", IMPORTED: imported}, 200
+
+
+def invalid_consistency_response(method: str) -> tuple:
+    """Response to a key request asking for an unknown consistency level
+
+    Args:
+        method (str): HTTP method of request
+
+    Returns:
+        tuple: json, status code
+    """
+    return {"message": f"Error in {method}", "error": INVALID_CONSISTENCY}, 400
+
+
 def view_change_response(template: dict):
     """Response from call to /kvs/view-change
 
@@ -74,6 +201,51 @@ def view_change_response(template: dict):
     return {"shards": template, "message": "View change successful"}, 200
 
 
+def invalid_context_response(method: str) -> tuple:
+    """Response to a request carrying a malformed causal context, or one with timestamps too far ahead
+
+    Args:
+        method (str): HTTP method of request
+
+    Returns:
+        tuple: json, status code
+    """
+    return {"message": f"Error in {method}", "error": INVALID_CONTEXT}, 400
+
+
+def invalid_view_response() -> tuple:
+    """Response to a view change movement request with an invalid view or replication factor
+
+    Returns:
+        tuple: json, status code
+    """
+    return {"message": "Error in view change movement", "error": INVALID_VIEW}, 400
+
+
+def view_change_movement_response(report: dict) -> tuple:
+    """Response from call to /kvs/view-change/movement
+
+    Args:
+        report (dict): key counts and keys moved, in total and per shard
+
+    Returns:
+        tuple: json, status code
+    """
+    return {"message": "View change movement computed successfully", **report}, 200
+
+
+def metrics_response(metrics: dict) -> tuple:
+    """Response from call to /kvs/metrics
+
+    Args:
+        metrics (dict): counters by subsystem
+
+    Returns:
+        tuple: json, status code
+    """
+    return {"message": "Metrics retrieved successfully", **metrics}, 200
+
+
 class GetResponse(typing.NamedTuple):
     """
     Response interface for GET requests
@@ -273,4 +445,4 @@ class DeleteResponse(typing.NamedTuple):
             address=address,
             message=message,
             error=error,
-        )
\ No newline at end of file
+        )
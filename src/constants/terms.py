@@ -12,6 +12,41 @@ SHARD_ID = "shard-id"
 KEY_COUNT = "key-count"
 REPLICAS = "replicas"
 GOSSIP_ID = "send-gossip"
+KEY_COUNTS_ID = "send-key-counts"
+TOMBSTONE_GC_ID = "collect-tombstones"
+SNAPSHOT_ID = "take-snapshot"
+SYNC_ID = "sync-log"
 PUT = "PUT"
 GET = "GET"
-DELETE = "DELETE"
\ No newline at end of file
+DELETE = "DELETE"
+INSTANCE = "instance"
+GOSSIP_FULL = "full"
+GOSSIP_DELTA = "delta"
+GOSSIP_MERKLE = "merkle"
+NODES = "nodes"
+HASHES = "hashes"
+PLACEMENT_RANGE = "range"
+PLACEMENT_RING = "ring"
+KEYS_MOVED = "keys-moved"
+UNREACHABLE = "unreachable"
+ONE = "ONE"
+QUORUM = "QUORUM"
+ALL = "ALL"
+CONSISTENCY = "consistency"
+SERVER_PRODUCTION = "production"
+SINCE = "since"
+SENDER = "sender"
+HORIZON = "horizon"
+KEYS = "keys"
+TIMESTAMPS = "timestamps"
+OPERATIONS = "operations"
+OPERATION = "op"
+RESULTS = "results"
+STATUS_CODE = "status-code"
+IMPORTED = "imported"
+MERGED = "merged"
+SHARD_COUNTS = "shard-counts"
+REPLICA_HORIZON = "replica-horizon"
+FSYNC_ALWAYS = "always"
+FSYNC_BATCHED = "batch"
+FSYNC_PERIODIC = "interval"
@@ -10,11 +10,18 @@ from routes.kvs import kvs_router
 
 from util.scheduler import Scheduler
 from util.misc import printer
+from constants.terms import SERVER_PRODUCTION
 
 app = Flask(__name__)
 app.register_blueprint(kvs_router, url_prefix="/kvs")
 
 if __name__ == "__main__":
-    app.run(
-        port=config.PORT, host=config.HOST, debug=True, use_reloader=False
-    )  # use_reloader=False prevents two inits
+    if config.SERVER == SERVER_PRODUCTION:
+        # single process, so all threads share one distributor's in-memory state
+        from waitress import serve
+
+        serve(app, host=config.HOST, port=config.PORT, threads=config.SERVER_THREADS)
+    else:
+        app.run(
+            port=config.PORT, host=config.HOST, debug=True, use_reloader=False
+        )  # use_reloader=False prevents two inits
@@ -1,16 +1,30 @@
 import os
 import sys
 import requests
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from util.distributor import KVSDistributor
+from util.view import View
 from constants.responses import (
     key_count_response,
+    gossip_response,
+    catch_up_response,
+    entries_response,
+    invalid_consistency_response,
+    invalid_context_response,
+    batch_response,
+    invalid_batch_response,
+    import_response,
+    shard_response,
+    timestamps_response,
     all_shards_info_response,
     single_shard_info_response,
     success_response,
     view_change_response,
+    view_change_movement_response,
+    invalid_view_response,
+    metrics_response,
 )
-from util.misc import printer
+from util.misc import printer, connection_stats
 from constants.terms import *
 
 address = os.getenv("ADDRESS")
@@ -37,10 +51,10 @@ def propogate_view_change():
     json = request.get_json()
     view = json.get(VIEW)
     repl_factor = json.get(REPL_FACTOR)
-    shard = kvs_distributor.change_view(
+    result = kvs_distributor.change_view(
         ips=view, repl_factor=repl_factor, propagate=False
     )
-    return {KVS_TERM: shard}, 200
+    return result, 200
 
 
 @kvs_router.route("/view-change", methods=[PUT])
@@ -62,9 +76,35 @@ def client_view_change():
     return view_change_response(template=template)
 
 
+@kvs_router.route("/view-change/movement", methods=[PUT])
+def view_change_movement():
+    """Report how many keys a view change would move, without performing it
+
+    JSON:
+        view (str/list): comma delimited IP addresses of each node in the network, list if sent by another node
+        repl-factor (int)
+
+    Returns:
+        tuple: json, status code
+    """
+    json = request.get_json()
+    view = json.get(VIEW)
+    # a client sends a comma delimited view, other nodes only ask for their own shard
+    propagate = isinstance(view, str)
+    if propagate:
+        view = view.split(",")
+    repl_factor = json.get(REPL_FACTOR)
+    if not View.valid(view, repl_factor):
+        return invalid_view_response()
+    report = kvs_distributor.keys_moved(
+        ips=view, repl_factor=repl_factor, propagate=propagate
+    )
+    return view_change_movement_response(report) if propagate else (report, 200)
+
+
 @kvs_router.route("/shard", methods=[PUT])
 def accept_shard():
-    """Absorb an incoming shard from another node
+    """Absorb part of a shard streamed from another node during a view change
 
     JSON:
         kvs (dict): key-value pairs to absorb
@@ -74,8 +114,8 @@ def accept_shard():
     """
     json = request.get_json()
     shard = json.get(KVS_TERM)
-    kvs_distributor.merge_shard(shard)
-    return success_response()
+    merged = kvs_distributor.merge_shard(shard)
+    return shard_response(merged)
 
 
 @kvs_router.route("/gossip", methods=[PUT])
@@ -84,13 +124,114 @@ def accept_gossip():
 
     JSON:
         kvs (dict): key-value pairs to absorb
+        sender (str, optional): IP address of gossiping node
+        horizon (int, optional): timestamp up to which gossip holds all of sender's writes
+        instance (str, optional): instance ID gossip was computed for, absent for a whole shard
+        shard-counts (dict, optional): key counts of buckets known to gossiping node
+        replica-horizon (int, optional): timestamp up to which gossiping node has every write of the bucket
 
     Returns:
         tuple: json, status code
     """
     json = request.get_json()
     shard = json.get(KVS_TERM)
-    kvs_distributor.merge_gossip(shard)
+    kvs_distributor.merge_gossip(
+        shard,
+        sender=json.get(SENDER),
+        horizon=json.get(HORIZON),
+        instance=json.get(INSTANCE),
+        shard_counts=json.get(SHARD_COUNTS),
+        replica_horizon=json.get(REPLICA_HORIZON),
+    )
+    return gossip_response(kvs_distributor.instance_id)
+
+
+@kvs_router.route("/gossip/digest", methods=[PUT])
+def gossip_digest():
+    """Compare KVS digests with another node
+
+    JSON:
+        nodes (list): [level, index] pairs of digest tree nodes to return hashes of
+
+    Returns:
+        tuple: json, status code
+    """
+    json = request.get_json()
+    nodes = json.get(NODES, [])
+    return {HASHES: kvs_distributor.digest_hashes(nodes)}, 200
+
+
+@kvs_router.route("/catch-up", methods=[PUT])
+def catch_up():
+    """Send a restarting replica the entries it missed
+
+    JSON:
+        since (float): latest write timestamp the replica already has
+
+    Returns:
+        tuple: json, status code
+    """
+    json = request.get_json()
+    since = json.get(SINCE, 0)
+    return catch_up_response(kvs_distributor.catch_up_shard(since))
+
+
+@kvs_router.route("/replicate", methods=[PUT])
+def replicate():
+    """Absorb writes sent by the replica of the bucket which applied them
+
+    JSON:
+        kvs (dict): key-value pairs to absorb
+
+    Returns:
+        tuple: json, status code
+    """
+    json = request.get_json()
+    kvs_distributor.merge_replicated(json.get(KVS_TERM, {}))
+    return success_response()
+
+
+@kvs_router.route("/entries", methods=[PUT])
+def entries():
+    """Get entries of keys, including deleted ones, for a replica reading at a consistency level
+
+    JSON:
+        keys (list): keys to get entries of
+
+    Returns:
+        tuple: json, status code
+    """
+    json = request.get_json()
+    return entries_response(kvs_distributor.entries(json.get(KEYS, [])))
+
+
+@kvs_router.route("/timestamps", methods=[PUT])
+def timestamps():
+    """Get last write timestamps of keys, for another bucket checking causal dependencies
+
+    JSON:
+        keys (list): keys to get timestamps of
+
+    Returns:
+        tuple: json, status code
+    """
+    json = request.get_json()
+    keys = json.get(KEYS, [])
+    return timestamps_response(kvs_distributor.dependency_timestamps(keys))
+
+
+@kvs_router.route("/key-counts", methods=[PUT])
+def accept_key_counts():
+    """Absorb key counts of buckets known to a node of another bucket
+
+    JSON:
+        shard-counts (dict): shard ID -> [key count, time counted]
+
+    Returns:
+        tuple: json, status code
+    """
+    json = request.get_json()
+    kvs_distributor.merge_shard_counts(json.get(SHARD_COUNTS, {}))
     return success_response()
 
 
@@ -127,6 +268,32 @@ def shard_info(shard_id):
         return all_shards_info_response(all_shards)
 
 
+@kvs_router.route("/metrics", methods=[GET])
+def metrics():
+    """Returns node performance counters
+
+    Returns:
+        tuple: json, status code
+    """
+    return metrics_response(
+        {
+            "connections": connection_stats(),
+            "remote-marks": kvs_distributor.remote_marks.stats(),
+            "foreign-values": kvs_distributor.foreign_values.stats(),
+            "replication": (
+                kvs_distributor.replicator.stats()
+                if kvs_distributor.replicator
+                else None
+            ),
+            "group-commit": kvs_distributor.put_commits.stats(),
+            "tombstones": {
+                "purged": kvs_distributor.tombstones_purged,
+                "stable-horizon": kvs_distributor.stable_horizon(),
+            },
+        }
+    )
+
+
 @kvs_router.route("/keys/<key>", methods=[GET, PUT, DELETE])
 def dynamic_key_route(key):
     """Handles all key adding, updating, and deleting in KVS
@@ -136,6 +303,8 @@ def dynamic_key_route(key):
 
     JSON:
         value: if PUT request, value to update key with in KVS
+        consistency (str, optional): ONE, QUORUM or ALL replicas to answer a read or store a write,
+            defaults to READ_CONSISTENCY or WRITE_CONSISTENCY
 
     Returns:
         tuple: json, status code
@@ -146,17 +315,78 @@ def dynamic_key_route(key):
     # ensure we can handle an empty string or any other bad value for context
     if not isinstance(context, list):
         context = []
+    if not kvs_distributor.valid_context(context):
+        return invalid_context_response(request.method)
+    consistency = json.get(CONSISTENCY)
+    if consistency not in (None, ONE, QUORUM, ALL):
+        return invalid_consistency_response(request.method)
     res = None
     if request.method == GET:
-        res = kvs_distributor.get(key, context)
+        res = kvs_distributor.get(key, context, consistency=consistency)
     elif request.method == PUT:
-        res = kvs_distributor.put(key, json.get(VALUE), context)
+        res = kvs_distributor.put(
+            key, json.get(VALUE), context, consistency=consistency
+        )
     elif request.method == DELETE:
-        res = kvs_distributor.delete(key, context)
+        res = kvs_distributor.delete(key, context, consistency=consistency)
 
     return res.to_flask_response(include_address=res.address != address)
 
 
+@kvs_router.route("/batch", methods=[PUT])
+def batch():
+    """Handles many key reads, writes and deletes sharing one causal context
+
+    JSON:
+        operations (list): operations applied, each with op (GET, PUT or DELETE), key and, for PUT, value
+        causal-context (list): causal context of the batch
+
+    Returns:
+        tuple: json, status code
+    """
+    json = request.get_json() or {}
+    operations = json.get(OPERATIONS, [])
+    if not isinstance(operations, list) or not all(
+        isinstance(operation, dict) for operation in operations
+    ):
+        return invalid_batch_response()
+    context = json.get(CAUSAL_CONTEXT, [])
+    # ensure we can handle an empty string or any other bad value for context
+    if not isinstance(context, list):
+        context = []
+    if not kvs_distributor.valid_context(context):
+        return invalid_context_response(request.method)
+    results, context = kvs_distributor.batch(operations, context)
+    return batch_response(results, context)
+
+
+@kvs_router.route("/export", methods=[GET])
+def export():
+    """Streams node's shard as newline delimited JSON, one [key, entry] record per line
+
+    Returns:
+        Response: chunked stream
+    """
+    return Response(
+        stream_with_context(kvs_distributor.export_records()),
+        mimetype="application/x-ndjson",
+    )
+
+
+@kvs_router.route("/import", methods=[PUT])
+def bulk_import():
+    """Ingests a stream in the format of /kvs/export, without reading it into memory whole
+
+    Body:
+        newline delimited JSON, one [key, entry] record per line
+
+    Returns:
+        tuple: json, status code
+    """
+    imported, error = kvs_distributor.import_records(request.stream)
+    return import_response(imported, error)
+
+
 # Dev Routes - Delete Before Submission
 
 
@@ -0,0 +1,170 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class HighWaterMarks:
+    """Size bounded cache of the latest timestamp each key is known to have reached
+
+    Marks only move forward, and a key whose mark is at or past a timestamp has been seen at that
+    timestamp for good, so cached answers never go stale. Least recently used keys are evicted first.
+
+    Args:
+        max_size (int): maximum number of keys kept
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.marks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.marks)
+
+    def covers(self, key: str, timestamp: int) -> bool:
+        """Check if a key is known to have reached a timestamp, counting a hit or miss
+
+        Args:
+            key (str)
+            timestamp (int)
+
+        Returns:
+            bool
+        """
+        with self.lock:
+            mark = self.marks.get(key)
+            if mark != None and mark >= timestamp:
+                self.marks.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def peek(self, key: str) -> int:
+        """Latest timestamp a key is known to have reached, without counting a lookup
+
+        Args:
+            key (str)
+
+        Returns:
+            int: None if unknown
+        """
+        return self.marks.get(key)
+
+    def update(self, key: str, timestamp: int):
+        """Record that a key reached a timestamp
+
+        Args:
+            key (str)
+            timestamp (int)
+        """
+        if timestamp == None:
+            return
+        with self.lock:
+            mark = self.marks.get(key)
+            if mark == None or timestamp > mark:
+                self.marks[key] = timestamp
+            self.marks.move_to_end(key)
+            while len(self.marks) > self.max_size:
+                self.marks.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Cache size and hit rate counters
+
+        Returns:
+            dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.marks),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit-rate": self.hits / lookups if lookups else 0,
+        }
+
+
+class VersionCache:
+    """Size bounded cache of the latest version seen of each key, served for a limited time
+
+    A version only replaces an older one, so a slow response cannot overwrite a newer version seen
+    meanwhile. Versions expire ttl seconds after being stored, bounding how stale they can be when
+    keys are written elsewhere. Least recently used keys are evicted first.
+
+    Args:
+        max_size (int): maximum number of keys kept, 0 caches nothing
+        ttl (float): seconds a version is served after being stored
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (timestamp of version, version, time.time() stored)
+        self.versions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.versions)
+
+    def get(self, key: str, valid: callable = None):
+        """Get the cached version of a key if fresh, counting a hit or miss
+
+        Args:
+            key (str)
+            valid (callable, optional): decides if a version may be served. Defaults to None (any version).
+
+        Returns:
+            version stored, None on a miss
+        """
+        with self.lock:
+            cached = self.versions.get(key)
+            if cached != None and time.time() - cached[2] > self.ttl:
+                del self.versions[key]
+                cached = None
+            if cached != None and (not valid or valid(cached[1])):
+                self.versions.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, timestamp: int, version):
+        """Cache a version of a key unless a newer one is cached
+
+        Args:
+            key (str)
+            timestamp (int): last write timestamp of version
+            version: anything
+        """
+        if not self.max_size or timestamp == None:
+            return
+        with self.lock:
+            cached = self.versions.get(key)
+            if cached != None and cached[0] > timestamp:
+                return
+            self.versions[key] = (timestamp, version, time.time())
+            self.versions.move_to_end(key)
+            while len(self.versions) > self.max_size:
+                self.versions.popitem(last=False)
+
+    def clear(self):
+        """Drop all versions"""
+        with self.lock:
+            self.versions.clear()
+
+    def stats(self) -> dict:
+        """Cache size and hit rate counters
+
+        Returns:
+            dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.versions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit-rate": self.hits / lookups if lookups else 0,
+        }
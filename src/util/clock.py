@@ -0,0 +1,104 @@
+import time
+import threading
+
+import config
+from util.misc import printer
+
+# low bits of a timestamp counting events within the same millisecond, few enough that timestamps
+# stay below 2 ** 53 and survive JSON clients parsing numbers as doubles
+LOGICAL_BITS = 10
+
+
+def physical(seconds: float) -> int:
+    """Convert wall clock seconds to timestamp units
+
+    Args:
+        seconds (float)
+
+    Returns:
+        int
+    """
+    return int(seconds * 1000) << LOGICAL_BITS
+
+
+class HybridLogicalClock:
+    """Hybrid logical clock issuing timestamps for writes
+
+    A timestamp is wall clock milliseconds shifted left by LOGICAL_BITS plus a logical counter, in a
+    single int. Timestamps issued by a node strictly increase, and stay ahead of every timestamp the
+    node has observed (see update), so a write causally following another always has a larger
+    timestamp, even when node clocks are skewed.
+
+    Observed timestamps are bounded to max_drift seconds ahead of the wall clock, so one bogus
+    timestamp cannot push every following one past 2 ** 53.
+
+    Args:
+        max_drift (float): seconds an observed timestamp may be ahead of the wall clock
+    """
+
+    def __init__(self, max_drift: float):
+        self.max_drift = max_drift
+        self.last = 0
+        self.lock = threading.Lock()
+
+    def bound(self) -> int:
+        """Latest timestamp accepted from elsewhere
+
+        Returns:
+            int
+        """
+        return physical(time.time() + self.max_drift)
+
+    def valid(self, timestamp) -> bool:
+        """Check if an untrusted timestamp is an integer no further ahead of the wall clock than max_drift
+
+        Args:
+            timestamp
+
+        Returns:
+            bool
+        """
+        return (
+            isinstance(timestamp, int)
+            and not isinstance(timestamp, bool)
+            and 0 <= timestamp <= self.bound()
+        )
+
+    def now(self) -> int:
+        """Issue a new timestamp
+
+        Returns:
+            int
+        """
+        with self.lock:
+            self.last = max(self.last + 1, physical(time.time()))
+            return self.last
+
+    def update(self, timestamp: int):
+        """Observe a timestamp issued elsewhere, so following timestamps are larger. Timestamps beyond
+        bound are clamped to it.
+
+        Args:
+            timestamp (int)
+        """
+        if timestamp > self.last:
+            bound = self.bound()
+            if timestamp > bound:
+                printer(
+                    f"Clamped timestamp {timestamp} more than {self.max_drift}s ahead"
+                )
+                timestamp = bound
+            with self.lock:
+                self.last = max(self.last, int(timestamp))
+
+    def peek(self) -> int:
+        """Latest timestamp issued or observed, without issuing a new one
+
+        Returns:
+            int
+        """
+        return self.last
+
+
+# shared by every KVS of the process
+clock = HybridLogicalClock(config.MAX_CLOCK_DRIFT)
@@ -0,0 +1,109 @@
+import threading
+
+
+class _Group:
+    """Items submitted together, and their results once committed"""
+
+    def __init__(self):
+        self.items = []
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class GroupCommit:
+    """Commits concurrently submitted items together in groups, one commit call per group
+
+    The first item of a group makes its thread the group's leader. The leader waits up to max_delay
+    seconds, or until max_size items joined, then commits the group while the other threads wait for
+    their results. Commits run one at a time, so items arriving during a commit form the next group
+    even without a delay.
+
+    Args:
+        commit (callable): takes a list of items, returns a list of their results in the same order
+        max_size (int): maximum items per group, 1 commits every item on its own
+        max_delay (float): seconds a leader waits for more items
+    """
+
+    def __init__(self, commit: callable, max_size: int, max_delay: float):
+        self.commit = commit
+        self.max_size = max_size
+        self.max_delay = max_delay
+        # group accepting items, None until the next item arrives
+        self.group = None
+        self.joined = threading.Condition()
+        # serializes commits
+        self.committing = threading.Lock()
+        self.groups = 0
+        self.items = 0
+
+    def _commit(self, group: _Group):
+        """Commit a closed group and release its waiting threads. Must hold committing."""
+        try:
+            group.results = self.commit(group.items)
+        except Exception as e:
+            group.error = e
+        self.groups += 1
+        self.items += len(group.items)
+        group.done.set()
+
+    # Public Functions
+
+    def submit(self, item):
+        """Commit an item as part of a group, blocking until its group is committed
+
+        Args:
+            item: passed to commit
+
+        Raises:
+            Exception: anything commit raised for the item's group
+
+        Returns:
+            result of commit for item
+        """
+        if self.max_size <= 1:
+            result = self.commit([item])[0]
+            with self.joined:
+                self.groups += 1
+                self.items += 1
+            return result
+        with self.joined:
+            group = self.group
+            leader = group == None
+            if leader:
+                group = self.group = _Group()
+            index = len(group.items)
+            group.items.append(item)
+            if len(group.items) >= self.max_size:
+                # full, later items start a new group
+                self.group = None
+                self.joined.notify_all()
+        if leader:
+            with self.joined:
+                if self.group is group and self.max_delay:
+                    self.joined.wait_for(
+                        lambda: self.group is not group, timeout=self.max_delay
+                    )
+            with self.committing:
+                with self.joined:
+                    # items kept joining while the previous group committed
+                    if self.group is group:
+                        self.group = None
+                self._commit(group)
+        else:
+            group.done.wait()
+        if group.error != None:
+            raise group.error
+        return group.results[index]
+
+    def stats(self) -> dict:
+        """Group counters
+
+        Returns:
+            dict
+        """
+        return {
+            "groups": self.groups,
+            "items": self.items,
+            "average-size": self.items / self.groups if self.groups else 0,
+        }
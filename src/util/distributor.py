@@ -1,23 +1,38 @@
 import sys
-import mmh3
+import json
+import time
+import uuid
+import threading
 import requests
 
-from util.kvs import KVS
+import config
+
+from util.kvs import KVS, KVSItem
 from util.view import View
+from util.placement import key_hash
 from util.misc import (
     request,
     printer,
     status_code_success,
     get_request_most_recent,
     key_count_max,
+    compact_context,
 )
 from util.scheduler import Scheduler
+from util.fanout import fan_out, executor, required_responses
+from util.persistence import Persistence, record
+from util.clock import clock, physical
+from util.cache import HighWaterMarks, VersionCache
+from util.replication import Replicator
+from util.commit import GroupCommit
 
 from constants.errors import (
     UNABLE_TO_SATISFY,
     KEY_TOO_LONG,
     KEY_NOT_EXIST,
     VALUE_MISSING,
+    INVALID_OPERATION,
+    CONSISTENCY_UNREACHABLE,
 )
 from constants.messages import (
     GET_SUCCESS,
@@ -43,15 +58,79 @@ class KVSDistributor:
     def __init__(self, ips: list, address: str, repl_factor: int):
         self.view = View(ips, address, repl_factor)
         self.kvs = KVS()
+        # identifies this process to peers, so they can detect a restart and resend everything
+        self.instance_id = uuid.uuid4().hex
+        # serializes view changes between request threads
+        self.view_lock = threading.RLock()
+        # foreign key -> latest timestamp its bucket is known to have seen, true across views
+        self.remote_marks = HighWaterMarks(config.REMOTE_MARKS_CACHE_SIZE)
+        # foreign key -> (value, context entry, address) of its latest version seen, see _cached_read
+        self.foreign_values = VersionCache(
+            config.FOREIGN_CACHE_SIZE, config.FOREIGN_CACHE_TTL
+        )
+        # deleted entries purged by tombstone collection since startup
+        self.tombstones_purged = 0
+        self.put_commits = GroupCommit(
+            self._commit_puts,
+            max_size=config.GROUP_COMMIT_SIZE,
+            max_delay=config.GROUP_COMMIT_DELAY,
+        )
+        self.replicator = None
+        if config.REPLICATION_INTERVAL:
+            # writes reach replicas within milliseconds, gossip only repairs what was lost
+            self.replicator = Replicator(config.REPLICATION_INTERVAL)
+        self.persistence = None
+        if config.DATA_DIR:
+            # recover entries written before a restart, then log every modification
+            self.persistence = Persistence(config.DATA_DIR)
+            restored = self.persistence.load(self.kvs)
+            printer(f"Restored {len(self.kvs)} keys from {restored} persisted records")
+            self.kvs.log = self.persistence
+            # state survived the restart, peers need not resend it
+            self.instance_id = self.persistence.instance_id()
+        self._reset_view_state()
+        self._catch_up()
         # schedule repeated gossip in bucket
         self._start_gossiping()
+        self._start_persisting()
 
     # Private Functions
 
+    def _reset_view_state(self):
+        """Reset all state derived from the current view"""
+        view = self.view
+        # per-peer gossip high-water marks, ip -> (peer instance ID, last acknowledged KVS sequence number)
+        self.gossip_marks = {}
+        # per-peer horizons, ip -> timestamp up to which all of the peer's writes were gossiped here
+        self.peer_horizons = {}
+        # horizons reported by peers, ip -> timestamp up to which the peer has every write of the bucket
+        self.replica_horizons = {}
+        # live key counts of other buckets, bucket index -> (count, time.time() it was counted)
+        self.shard_counts = {}
+        # rotates the replica of each bucket key counts are sent to
+        self.key_count_rounds = 0
+        # cached keys may now belong to node's own bucket
+        self.foreign_values.clear()
+        if self.replicator:
+            self.replicator.set_replicas(
+                view.self_replication_bucket(own_ip=False)
+                if view.includes_own_address()
+                else []
+            )
+
     def _request_multiple_ips(
-        self, ips: list, url: str, method: str, headers: dict = {}, json=None
+        self,
+        ips: list,
+        url: str,
+        method: str,
+        headers: dict = {},
+        json=None,
+        timeout: float = None,
+        until: str = ALL,
+        accept: callable = None,
+        deadline: float = None,
     ) -> list:
-        """Performs a number of sequential requests to multiple IP addresses
+        """Performs a number of concurrent requests to multiple IP addresses
 
         Args:
             ips (list). List of addresses to request to.
@@ -59,6 +138,10 @@ class KVSDistributor:
             method (str)
             headers (dict, optional). Defaults to {}.
             json (list/dict, optional). Allows for unique json to each ip (list) or identical json (dict). Defaults to None.
+            timeout (float, optional): seconds to wait for each response. Defaults to None (request default).
+            until (str, optional): return early once ONE, a QUORUM or ALL requests are accepted. Defaults to ALL.
+            accept (callable, optional): decides if a (response, IP) tuple counts towards `until`. Defaults to None (any response).
+            deadline (float, optional): seconds to wait for responses overall. Defaults to None (no deadline).
 
         Returns:
             list: tuples with each item being of type (response, IP address of response origin)
@@ -67,21 +150,26 @@ class KVSDistributor:
             json = [{} for ip in ips]  # default empty json
         elif isinstance(json, dict):
             json = [json for ip in ips]  # reuse same json n-1 times
-        responses = []
-        for index, ip in enumerate(ips):
-            if ip != self.view.address:
-                url_complete = ip + url
-                try:
-                    responses.append(
-                        (request(url_complete, method, headers, json[index]), ip)
-                    )
-                except requests.exceptions.ConnectionError:
-                    # printer(f"Connection error to IP: {ip}")
-                    pass
-        return responses
+
+        def request_ip(ip, json):
+            return request(ip + url, method, dict(headers), json, timeout), ip
+
+        tasks = [
+            # bind loop variables now, tasks run later
+            lambda ip=ip, json=json[index]: request_ip(ip, json)
+            for index, ip in enumerate(ips)
+            if ip != self.view.address
+        ]
+        return fan_out(tasks, until=until, accept=accept, deadline=deadline)
 
     def _request_bucket(
-        self, bucket: list, url: str, method: str, headers: dict = {}, json={}
+        self,
+        bucket: list,
+        url: str,
+        method: str,
+        headers: dict = {},
+        json={},
+        timeout: float = None,
     ) -> tuple:
         """Request nodes in a bucket until a valid response is returned
 
@@ -91,6 +179,7 @@ class KVSDistributor:
             method (str)
             headers (dict, optional). Defaults to {}.
             json (dict, optional) . Defaults to {}.
+            timeout (float, optional): seconds to wait for each response. Defaults to None (request default).
 
         Returns:
             tuple: requests.Response, IP of request
@@ -98,7 +187,7 @@ class KVSDistributor:
         for ip in bucket:
             try:
                 url_complete = ip + url
-                response = request(url_complete, method, headers, json)
+                response = request(url_complete, method, headers, json, timeout)
                 if response.status_code != 500:
                     return response, ip
             except requests.exceptions.ConnectionError:
@@ -107,110 +196,594 @@ class KVSDistributor:
         # TODO: Figure out if this use case needs to be handled...
         return None, None
 
-    def _causal_context_ahead(self, key: str, context: list = []) -> bool:
+    def _causal_context_ahead(self, key: str, view: View, context: list = []) -> bool:
         """Checks if local context is behind given context when reading a key
 
         Args:
             key (str): key being read in current request
+            view (View): view the request is served under
             context (list, optional): causal context passed in through client request. Defaults to [].
                 ex. [
                     ["a", {
-                        "cause": [["b", 1594370977.537462]],
+                        "cause": [["b", 1632635880997888]],
                         "deleted": false,
-                        "last-write": 1607370977.5734642
+                        "last-write": 1645947881034752
                     }]
                 ]
                 Each item in context is a two item list of [key, entry]. The entry portion stores the
                 last write timestamp when the key was written/deleted during the operation involving said key, whether the key is deleted,
                 and the causal writes which led to the key's last write. In this example, key "a" was written as a cause
-                of key "b" being written at 1594370977.537462.
+                of key "b" being written at 1632635880997888. Timestamps are hybrid logical clock values, see util.clock.
+                Contexts are compacted to one entry per key, see util.misc.compact_context.
+
+        Dependencies are grouped by bucket. A bucket whose horizon covers its latest dependency
+        satisfies all of them at once, otherwise each dependency is checked against the bucket's
+        last write timestamps. Foreign buckets are asked for both in a single request per bucket,
+        all in parallel. Writes they confirm, or proxied requests observed, are remembered in
+        remote_marks so repeat checks are free.
 
         Returns:
             bool: is passed in context ahead
+        """
+        # latest timestamp required of each key the context depends on, so each is checked once
+        dependencies = {}
+        for context_key, context_entry in context:
+            cause = context_entry.get(CAUSE, [])
+            if context_key == key:
+                # never read a key older than the context has already seen
+                cause = cause + [[key, context_entry.get(TIMESTAMP, 0)]]
+            for causal_key, key_ts in cause:
+                if causal_key not in dependencies or key_ts > dependencies[causal_key]:
+                    dependencies[causal_key] = key_ts
+        # bucket index -> {key: timestamp}
+        bucket_dependencies = {}
+        for causal_key, key_ts in dependencies.items():
+            bucket_id = view.key_bucket_index(causal_key)
+            bucket_dependencies.setdefault(bucket_id, {})[causal_key] = key_ts
+        foreign = []
+        for bucket_id, dependencies in bucket_dependencies.items():
+            if not view.is_own_bucket_index(bucket_id):
+                # writes another bucket is known to have seen need not be checked again
+                unconfirmed = {
+                    causal_key: key_ts
+                    for causal_key, key_ts in dependencies.items()
+                    if not self.remote_marks.covers(causal_key, key_ts)
+                }
+                if unconfirmed:
+                    foreign.append((view.buckets[bucket_id], unconfirmed))
+                continue
+            horizon = self.horizon()
+            if max(dependencies.values()) <= horizon:
+                continue
+            for causal_key, key_ts in dependencies.items():
+                if key_ts <= horizon:
+                    # seen, even if a deleted entry has since been purged
+                    continue
+                entry = self.kvs.get(causal_key)
+                if (
+                    # key not in KVS, node cannot provide a value
+                    not entry
+                    # key's ts in kvs behind expected event
+                    or entry.last_write() < key_ts
+                ):
+                    return True
+        # one batched request per foreign bucket, all buckets in parallel
+        tasks = [
+            # bind loop variables now, tasks run later
+            lambda args=args: self._check_foreign_dependencies(*args)
+            for args in foreign
+        ]
+        results = fan_out(tasks, deadline=config.REQUEST_DEADLINE)
+        # cannot provide the event either because foreign shard has partition or node down
+        return len(results) < len(tasks) or not all(results)
 
+    def _observe_context(self, context: list):
+        """Advance clock past the writes in a causal context, so writes following it are ordered after them
 
+        Args:
+            context (list): causal context
         """
-
         for _, context_entry in context:
-            cause = context_entry[CAUSE]
-            for causal_key, key_ts in cause:
-                # get each causal key in each item of the given context
-                bucket_id = self._assign_key_bucket(key)
-                if self.view.is_own_bucket_index(bucket_id):
-                    if (
-                        # key not in KVS, node cannot provide a value
-                        not self.kvs.get(causal_key)
-                        # key's ts in kvs behind expected event
-                        or self.kvs.get(causal_key).last_write() < key_ts
-                    ):
-                        return True
-                else:
-                    # query another bucket for key's last write ts
-                    foreign_response = self.get(key)
-                    # cannot provide the event either because foreign shard has partition or node down
-                    if (
-                        # if no success responses
-                        foreign_response.status_code != 200
-                        or foreign_response.json()
-                        # or node gets a timestamp behind the one being checked
-                        .get(CAUSAL_CONTEXT).get(key).get(TIMESTAMP) < key_ts
-                    ):
-                        return True
+            clock.update(context_entry.get(TIMESTAMP, 0))
+
+    def _check_foreign_dependencies(self, bucket: list, dependencies: dict) -> bool:
+        """Check if another bucket has seen writes, asking its replicas in turn for the last write
+        timestamps of all keys in one request, until every write is confirmed by some replica
+
+        Args:
+            bucket (list): IP addresses of bucket's replicas
+            dependencies (dict): key -> timestamp of write required
+
+        Returns:
+            bool: are all writes seen
+        """
+        for ip in bucket:
+            try:
+                response = request(
+                    ip + "/kvs/timestamps", PUT, json={KEYS: list(dependencies)}
+                )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ):
+                continue
+            if not status_code_success(response.status_code):
+                continue
+            json = response.json()
+            horizon = json.get(HORIZON, 0)
+            if horizon >= max(dependencies.values()):
+                # replica has every write of its bucket up to the latest dependency
+                for causal_key, key_ts in dependencies.items():
+                    self.remote_marks.update(causal_key, key_ts)
+                return True
+            timestamps = json.get(TIMESTAMPS, {})
+            seen = {
+                causal_key: timestamps[causal_key]
+                for causal_key, key_ts in dependencies.items()
+                # a write behind the horizon is seen, even if a deleted entry has since been purged
+                if max(timestamps.get(causal_key) or 0, horizon) >= key_ts
+            }
+            for causal_key, key_ts in seen.items():
+                self.remote_marks.update(causal_key, key_ts)
+            dependencies = {
+                causal_key: key_ts
+                for causal_key, key_ts in dependencies.items()
+                if causal_key not in seen
+            }
+            if not dependencies:
+                return True
         return False
 
-    def _assign_key_bucket(self, key: str, num_buckets: int = None) -> int:
-        """Determines which replica bucket is assigned a key based on number of buckets and Murmurhash
+    def _remember_proxied_write(self, key: str, response):
+        """Remember the write of a foreign key seen by a proxied request, so later causal checks
+        depending on it need not ask its bucket
 
         Args:
             key (str)
-            num_buckets (int, optional): number of buckets to consider when hashing. Defaults to None.
+            response (GetResponse | PutResponse | DeleteResponse): response of key's bucket
 
         Returns:
-            int: index in self.view.buckets
+            GetResponse | PutResponse | DeleteResponse: same response
         """
-        if not num_buckets:
-            num_buckets = self.view.num_buckets()
-        hashed = mmh3.hash128(key, signed=False)
-        p = hashed / float(2 ** 128)
-        for bucket_index in range(0, num_buckets):
-            if (
-                bucket_index / float(num_buckets) <= p
-                and (bucket_index + 1) / float(num_buckets) > p
-            ):
-                return bucket_index
-        return num_buckets - 1
+        if status_code_success(response.status_code):
+            for context_key, context_entry in response.context or []:
+                if context_key == key:
+                    self.remote_marks.update(key, context_entry.get(TIMESTAMP))
+        return response
+
+    def _replicas_needed(self, consistency: str, view: View) -> tuple:
+        """Other replicas of own bucket, and how many of them must answer for node to reach a consistency level
+
+        Args:
+            consistency (str): ONE, QUORUM or ALL
+            view (View): view the request is served under
+
+        Returns:
+            tuple: list of IP addresses, int
+        """
+        peers = view.self_replication_bucket(own_ip=False)
+        return peers, required_responses(consistency, len(peers) + 1) - 1
+
+    def _read_replicas(self, key: str, consistency: str, view: View) -> bool:
+        """Merge the entries of an own key held by other replicas, asked in parallel until enough
+        answered to reach a consistency level, so a local read then returns the latest of them
+
+        Args:
+            key (str)
+            consistency (str): ONE, QUORUM or ALL
+            view (View): view the request is served under
+
+        Returns:
+            bool: was consistency level reached
+        """
+        peers, needed = self._replicas_needed(consistency, view)
+        if needed <= 0:
+            return True
+        responses = self._request_multiple_ips(
+            ips=peers,
+            url="/kvs/entries",
+            method=PUT,
+            json={KEYS: [key]},
+            until=needed,
+            accept=lambda r: status_code_success(r[0].status_code),
+            deadline=config.REQUEST_DEADLINE,
+        )
+        answered = 0
+        for response, ip in responses:
+            if status_code_success(response.status_code):
+                self.kvs.merge(response.json().get(KVS_TERM, {}))
+                answered += 1
+        return answered >= needed
+
+    def _replicate_entries(self, entries: dict, needed: int, view: View) -> int:
+        """Send entries of own keys just written to the other replicas in one request each, in parallel,
+        returning once enough stored them. Remaining replicas receive them in the background. If no
+        replica is needed, entries are only queued for the replicator, if any.
+
+        Args:
+            entries (dict): key -> JSON serialized entry
+            needed (int): replicas besides node which must store entries, see _replicas_needed
+            view (View): view the request is served under
+
+        Returns:
+            int: number of replicas which stored entries
+        """
+        if needed <= 0:
+            if self.replicator:
+                for key, entry in entries.items():
+                    self.replicator.push(key, entry)
+            # otherwise replicas learn of the writes through gossip
+            return 0
+        responses = self._request_multiple_ips(
+            ips=view.self_replication_bucket(own_ip=False),
+            url="/kvs/replicate",
+            method=PUT,
+            json={KVS_TERM: entries},
+            until=needed,
+            accept=lambda r: status_code_success(r[0].status_code),
+            deadline=config.REQUEST_DEADLINE,
+        )
+        return len([r for r in responses if status_code_success(r[0].status_code)])
+
+    def _replicate_write(
+        self, key: str, item: KVSItem, consistency: str, view: View
+    ) -> bool:
+        """Send the entry of an own key just written to enough replicas to reach a consistency level
+
+        Args:
+            key (str)
+            item (KVSItem): entry stored for key
+            consistency (str): ONE, QUORUM or ALL
+            view (View): view the request is served under
+
+        Returns:
+            bool: was consistency level reached
+        """
+        _, needed = self._replicas_needed(consistency, view)
+        entries = {key: item.json()}
+        return self._replicate_entries(entries, needed, view) >= needed
+
+    def _commit_puts(self, writes: list) -> list:
+        """Apply a group of local PUTs, see put, with one write-ahead log append and one replication
+        request per replica, waiting for the most replicas any of them needs
+
+        Args:
+            writes (list): (key, value, cause, consistency) tuples
+
+        Returns:
+            list: (inserted, KVSItem stored, was consistency level reached) tuple for each write
+        """
+        # one view for the whole group
+        view = self.view
+        results = self.kvs.upsert_many(
+            [(key, value, cause) for key, value, cause, _ in writes]
+        )
+        # latest entry of each key
+        entries = {
+            key: item.json() for (key, _, _, _), (_, item) in zip(writes, results)
+        }
+        needed = [
+            self._replicas_needed(consistency, view)[1] for *_, consistency in writes
+        ]
+        stored = self._replicate_entries(entries, max(needed), view)
+        return [
+            (inserted, item, stored >= write_needed)
+            for (inserted, item), write_needed in zip(results, needed)
+        ]
+
+    def _cache_proxied_version(self, key: str, response, value: str = None):
+        """Cache the version of a foreign key seen by a successful proxied request, see _cached_read
+
+        Args:
+            key (str)
+            response (GetResponse | PutResponse | DeleteResponse): response of key's bucket
+            value (str, optional): value written, for a PUT. Defaults to None.
+        """
+        if not status_code_success(response.status_code):
+            return
+        for context_key, context_entry in response.context or []:
+            if context_key == key:
+                self.foreign_values.put(
+                    key,
+                    context_entry.get(TIMESTAMP),
+                    (value, context_entry, response.address),
+                )
+
+    def _cached_read(self, key: str, context: list) -> GetResponse:
+        """Serve a read of a foreign key from the version of it last seen by node
+
+        The version is only served if it is at least as recent as every write of the key the context
+        depends on, and as the latest write of the key node knows of (see remote_marks), so it never
+        goes back in causal order.
+
+        Args:
+            key (str)
+            context (list): compacted causal context
+
+        Returns:
+            GetResponse: None if no version may be served
+        """
+        # latest write of key the context depends on, read or written directly, or a cause
+        required = 0
+        for context_key, context_entry in context:
+            if context_key == key:
+                required = max(required, context_entry.get(TIMESTAMP, 0))
+            for causal_key, key_ts in context_entry.get(CAUSE, []):
+                if causal_key == key:
+                    required = max(required, key_ts)
+        required = max(required, self.remote_marks.peek(key) or 0)
+        version = self.foreign_values.get(
+            key, valid=lambda version: version[1].get(TIMESTAMP, 0) >= required
+        )
+        if version == None:
+            return None
+        value, context_entry, address = version
+        if context_entry.get(DELETED):
+            return GetResponse(
+                status_code=404,
+                value=None,
+                context=context,
+                address=address,
+                error=KEY_NOT_EXIST,
+            )
+        return GetResponse(
+            status_code=200,
+            value=value,
+            context=compact_context(context + [[key, context_entry]]),
+            address=address,
+            error=None,
+            message=GET_SUCCESS,
+        )
+
+    def _apply_operation(self, operation: dict, context: list, view: View) -> tuple:
+        """Apply a single GET or DELETE of a batch, see batch
+
+        Args:
+            operation (dict): op (GET or DELETE) and key
+            context (list): causal context
+            view (View): view the batch is served under
+
+        Returns:
+            tuple: see _operation_result
+        """
+        key = operation[KEY]
+        if operation[OPERATION] == GET:
+            response = self.get(key, context, view=view)
+        else:
+            response = self.delete(key, context, view=view)
+        return self._operation_result(key, response, context)
+
+    def _operation_result(self, key: str, response, context: list) -> tuple:
+        """Result of an operation of a batch from its response
+
+        Args:
+            key (str)
+            response (GetResponse | PutResponse | DeleteResponse)
+            context (list): causal context before operation
+
+        Returns:
+            tuple: result (as returned by the single key route, with key and status code but
+                without causal context), and causal context following operation
+        """
+        json, status_code = response.to_flask_response(include_address=False)
+        json.pop(CAUSAL_CONTEXT, None)
+        # failed causal checks and unreachable buckets return no context
+        if isinstance(response.context, list):
+            context = response.context
+        return {KEY: key, STATUS_CODE: status_code, **json}, context
+
+    def _invalid_put(
+        self, key: str, value: str, context: list, view: View
+    ) -> PutResponse:
+        """Reject a PUT of an own key with an invalid key or a missing value, see put
+
+        Args:
+            key (str)
+            value (str)
+            context (list): compacted causal context
+            view (View): view the request is served under
+
+        Returns:
+            PutResponse: None if PUT is valid
+        """
+        # key invalid
+        if not self._key_valid(key):
+            return PutResponse(
+                status_code=400,
+                error=KEY_TOO_LONG,
+                address=view.address,
+                context=context,
+            )
+        elif value == None:
+            # value missing
+            return PutResponse(
+                status_code=400,
+                error=VALUE_MISSING,
+                address=view.address,
+                context=context,
+            )
+        return None
+
+    def _committed_put(
+        self, key: str, committed: tuple, context: list, view: View
+    ) -> PutResponse:
+        """Response to a PUT of an own key once committed, see put
+
+        Args:
+            key (str)
+            committed (tuple): result of the write, see _commit_puts
+            context (list): compacted causal context before the write
+            view (View): view the request is served under
+
+        Returns:
+            PutResponse
+        """
+        inserted, item, replicated = committed
+        context = compact_context(context + [[key, item.context()]])
+        if not replicated:
+            # write is kept, and reaches remaining replicas through gossip
+            return PutResponse(
+                status_code=503,
+                context=context,
+                address=view.address,
+                error=CONSISTENCY_UNREACHABLE,
+            )
+        if inserted:
+            return PutResponse(
+                status_code=201,
+                context=context,
+                address=view.address,
+                message=PUT_NEW_SUCCESS,
+            )
+        else:
+            return PutResponse(
+                status_code=200,
+                context=context,
+                address=view.address,
+                message=PUT_UPDATE_SUCCESS,
+            )
+
+    def _forward_batch(self, bucket: list, operations: list, context: list):
+        """Send a bucket the operations of a batch on its keys, as one sub-batch
+
+        Args:
+            bucket (list): IP addresses of bucket's replicas
+            operations (list)
+            context (list): causal context
+
+        Returns:
+            requests.Response: None if the entire bucket failed to respond
+        """
+        json = {OPERATIONS: operations, CAUSAL_CONTEXT: context}
+        response, _ = self._request_bucket(
+            bucket=bucket,
+            url="/kvs/batch",
+            method=PUT,
+            json=json,
+            timeout=config.BATCH_TIMEOUT,
+        )
+        return response
+
+    def _reshard(self, old_bucket: list) -> int:
+        """Stream keys to the replicas that need them under the current view, and drop keys no longer owned
+
+        Keys leaving this node's bucket are sent to every replica of their new bucket, even replicas
+        which held them before, and only dropped once one of those replicas stored them. Keys staying
+        are sent to the replicas joining the bucket.
+
+        Args:
+            old_bucket (list): IP addresses that replicated this node's keys in the previous view
+
+        Returns:
+            int: number of keys sent or dropped
+        """
+        view = self.view
+        own_index = view.bucket_index
+        targets = [
+            # own bucket only needs the replicas that did not hold this node's keys before
+            (
+                [ip for ip in bucket if ip not in old_bucket]
+                if index == own_index
+                else bucket
+            )
+            for index, bucket in enumerate(view.buckets)
+        ]
+        chunks = [{} for bucket in view.buckets]
+        moved = 0
+
+        def flush(bucket_index: int) -> int:
+            """Send the chunk of a bucket, returning the number of keys moved"""
+            chunk = chunks[bucket_index]
+            chunks[bucket_index] = {}
+            sent = self._send_shard_chunk(targets[bucket_index], chunk)
+            if bucket_index == own_index:
+                # replicas that missed the chunk get the keys through gossip
+                return len(chunk)
+            if not sent:
+                # keep the only copies, the next view change retries them
+                printer(
+                    f"Kept {len(chunk)} keys no replica of bucket {bucket_index} stored"
+                )
+                return 0
+            for key in chunk:
+                self.kvs.remove(key)
+            return len(chunk)
 
-    def _shard_keys(self, kvs: dict) -> list:
-        """Shard keys of given KVS to all available buckets
+        # iterate over a snapshot, shards from other nodes may be merged meanwhile
+        for key, entry in self.kvs:
+            bucket_index = view.key_bucket_index(key)
+            if not targets[bucket_index]:
+                continue
+            # deleted entries are sent as well, so a stale replica cannot resurrect a key
+            chunk = chunks[bucket_index]
+            chunk[key] = {**entry.json(), CAUSE: []}
+            if len(chunk) >= config.RESHARD_CHUNK_SIZE:
+                moved += flush(bucket_index)
+        for bucket_index, chunk in enumerate(chunks):
+            if chunk:
+                moved += flush(bucket_index)
+        # causal context is not persisted between views
+        self.kvs.reset_context(purge_deleted=False)
+        return moved
+
+    def _send_shard_chunk(self, ips: list, chunk: dict) -> list:
+        """Send part of a shard to nodes of a bucket
 
         Args:
-            kvs (dict)
+            ips (list): IP addresses to send to
+            chunk (dict): JSON serialized entries
 
         Returns:
-            list: list of dicts with length number of buckets. Each dict is a KVS shard.
+            list: number of entries written by each node that stored the chunk, empty if none did
         """
-        distributed_keys = [{} for bucket in self.view.buckets]
-        for key in kvs:
-            bucket_index = self._assign_key_bucket(key)
-            distributed_keys[bucket_index][key] = kvs.get(key)
-        return distributed_keys
+        # if a node fails to get the chunk, gossip from its replicas will handle it
+        responses = self._request_multiple_ips(
+            ips=ips,
+            url="/kvs/shard",
+            method=PUT,
+            json={KVS_TERM: chunk},
+            timeout=config.VIEW_CHANGE_TIMEOUT,
+            deadline=config.VIEW_CHANGE_TIMEOUT,
+        )
+        return [
+            response.json().get(MERGED, 0)
+            for response, _ in responses
+            if status_code_success(response.status_code)
+        ]
+
+    def _import_chunk(self, bucket_index: int, chunk: dict, view: View) -> int:
+        """Merge imported entries into the KVS of their bucket
+
+        Args:
+            bucket_index (int)
+            chunk (dict): JSON serialized entries
+            view (View): view the import is served under
 
-    def _generate_replica_template(self, bucket_shards: list) -> list:
+        Returns:
+            int: number of entries written
+        """
+        if view.is_own_bucket_index(bucket_index):
+            # replicas get them through gossip
+            return self.kvs.merge(chunk)
+        return max(self._send_shard_chunk(view.buckets[bucket_index], chunk), default=0)
+
+    def _generate_replica_template(self, key_counts: list) -> list:
         """Creates expected tamplate for a view change response to client
 
         Args:
-            bucket_shards (list): response from _shard_keys
+            key_counts (list): key count of each bucket
 
         Returns:
             list: shards in expected format
         """
+        view = self.view
         return [
             {
                 SHARD_ID: index,
-                KEY_COUNT: len(bucket_shards[index]),
-                REPLICAS: self.view.buckets[index],
+                KEY_COUNT: key_count,
+                REPLICAS: view.buckets[index],
             }
-            for index, _ in enumerate(bucket_shards)
+            for index, key_count in enumerate(key_counts)
         ]
 
     def _key_valid(self, key: str) -> bool:
@@ -224,31 +797,259 @@ class KVSDistributor:
         """
         return isinstance(key, str) and len(key) <= 50
 
+    def _catch_up(self):
+        """Fetch writes missed while node was down from one replica of own bucket
+
+        Only entries written after the latest restored write (less CATCH_UP_MARGIN) are requested, so
+        catching up takes time proportional to downtime rather than shard size.
+        """
+        view = self.view
+        if not view.includes_own_address() or view.repl_factor < 2:
+            return
+        latest = self.kvs.latest_write()
+        since = max(latest - physical(config.CATCH_UP_MARGIN), 0)
+        for ip in view.self_replication_bucket(own_ip=False):
+            try:
+                # bulk transfer after a long downtime, allow as long as resharding
+                response = request(
+                    ip + "/kvs/catch-up",
+                    PUT,
+                    json={SINCE: since},
+                    timeout=config.VIEW_CHANGE_TIMEOUT,
+                )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ):
+                continue
+            if status_code_success(response.status_code):
+                written = self.kvs.merge(response.json().get(KVS_TERM))
+                printer(f"Caught up {written} keys from {ip}")
+                return
+
     def _start_gossiping(self):
         """Initiate repeating gossip protocol"""
-        if self.view.repl_factor > 1:
+        view = self.view
+        if view.repl_factor > 1:
             # should not gossip if one replica per shard
             Scheduler.add_job(
                 function=self._send_gossip,
                 seconds=GOSSIP_INTERVAL,
                 id=GOSSIP_ID,
             )
+        # with a single replica every write is stable at once
+        Scheduler.add_job(
+            function=self.collect_tombstones,
+            seconds=config.TOMBSTONE_GC_INTERVAL,
+            id=TOMBSTONE_GC_ID,
+        )
+        if view.num_buckets() > 1:
+            # key counts are exchanged between buckets, with or without replicas
+            Scheduler.add_job(
+                function=self._send_key_counts,
+                seconds=GOSSIP_INTERVAL,
+                id=KEY_COUNTS_ID,
+            )
+
+    def _known_shard_counts(self) -> dict:
+        """Live key counts of all buckets known to node, including its own
+
+        Returns:
+            dict: bucket index -> [count, time.time() it was counted]
+        """
+        view = self.view
+        shard_counts = {
+            index: [count, counted_at]
+            for index, (count, counted_at) in self.shard_counts.items()
+        }
+        if view.includes_own_address():
+            shard_counts[view.bucket_index] = [self.kvs.live, time.time()]
+        return shard_counts
+
+    def _send_key_counts(self):
+        """Send the key counts known to node to one replica of every other bucket, which relays them
+        to its replicas through gossip. Lets key_count answer for other buckets without requests.
+        """
+        view = self.view
+        if not view.includes_own_address():
+            return
+        position = view.self_replication_bucket().index(view.address)
+        self.key_count_rounds += 1
+        ips = [
+            # replicas of a bucket take turns, so each hears from every bucket regularly
+            bucket[(position + self.key_count_rounds) % len(bucket)]
+            for index, bucket in enumerate(view.buckets)
+            if not view.is_own_bucket_index(index)
+        ]
+        self._request_multiple_ips(
+            ips=ips,
+            url="/kvs/key-counts",
+            method=PUT,
+            json={SHARD_COUNTS: self._known_shard_counts()},
+            deadline=GOSSIP_INTERVAL,
+        )
+
+    def _start_persisting(self):
+        """Initiate repeating snapshots, and log syncs covering idle periods"""
+        if self.persistence:
+            Scheduler.add_job(
+                function=self.persistence.snapshot,
+                args=[self.kvs],
+                seconds=config.SNAPSHOT_INTERVAL,
+                id=SNAPSHOT_ID,
+            )
+            if self.persistence.fsync_policy != FSYNC_ALWAYS:
+                Scheduler.add_job(
+                    function=self.persistence.sync,
+                    seconds=config.FSYNC_INTERVAL,
+                    id=SYNC_ID,
+                )
 
     def _send_gossip(self):
         """Internal mechanism for sending updates between replicas"""
-        if self.view.includes_own_address():
-            bucket = self.view.self_replication_bucket(own_ip=False)
+        view = self.view
+        if view.includes_own_address():
+            bucket = view.self_replication_bucket(own_ip=False)
             url = "/kvs/gossip"
-            json = {KVS_TERM: self.kvs.json()}
-            self._request_multiple_ips(ips=bucket, url=url, method=PUT, json=json)
+            if config.GOSSIP_MODE == GOSSIP_FULL:
+                shard, horizon = self.kvs.json_since(0)
+                json = {
+                    KVS_TERM: shard,
+                    SENDER: view.address,
+                    HORIZON: horizon,
+                    REPLICA_HORIZON: self.horizon(),
+                    SHARD_COUNTS: self._known_shard_counts(),
+                }
+                self._request_multiple_ips(
+                    ips=bucket, url=url, method=PUT, json=json, deadline=GOSSIP_INTERVAL
+                )
+            elif config.GOSSIP_MODE == GOSSIP_MERKLE:
+                for ip in bucket:
+                    self._send_gossip_merkle(ip, url)
+            else:
+                self._send_gossip_delta(bucket, url)
         else:
-            Scheduler.clear_jobs()
+            Scheduler.remove_job(GOSSIP_ID)
+
+    def _send_gossip_delta(self, bucket: list, url: str):
+        """Send each replica only the entries written since it last acknowledged gossip
+
+        Args:
+            bucket (list): IP addresses of replicas to gossip to
+            url (str)
+        """
+        seq = self.kvs.seq
+        marks = [self.gossip_marks.get(ip, (None, 0)) for ip in bucket]
+        json = []
+        shard_counts = self._known_shard_counts()
+        replica_horizon = self.horizon()
+        for instance, mark in marks:
+            delta, horizon = self.kvs.json_since(mark)
+            json.append(
+                {
+                    KVS_TERM: delta,
+                    SENDER: self.view.address,
+                    HORIZON: horizon,
+                    # delta is only complete for the instance which acknowledged the mark
+                    INSTANCE: instance if mark else None,
+                    REPLICA_HORIZON: replica_horizon,
+                    SHARD_COUNTS: shard_counts,
+                }
+            )
+        # replicas not answering in time are sent the same delta again next round
+        responses = self._request_multiple_ips(
+            ips=bucket, url=url, method=PUT, json=json, deadline=GOSSIP_INTERVAL
+        )
+        for response, ip in responses:
+            if not status_code_success(response.status_code):
+                continue
+            instance = response.json().get(INSTANCE)
+            previous_instance, _ = self.gossip_marks.get(ip, (instance, 0))
+            if instance != previous_instance:
+                # peer restarted since its last ack and lost its state, start over
+                self.gossip_marks[ip] = (instance, 0)
+            else:
+                self.gossip_marks[ip] = (instance, seq)
+
+    def _send_gossip_merkle(self, ip: str, url: str):
+        """Compare digests with a replica top-down and send only the entries in differing leaves
+
+        Entries in equal leaves are identical, and entries in differing leaves are all sent, so once
+        sent the replica has every write node held when the comparison started, up to its horizon.
+
+        Args:
+            ip (str): IP address of replica
+            url (str): gossip URL differing entries are sent to
+        """
+        # taken first, writes during the comparison may be missed
+        horizon = self.kvs.horizon()
+        replica_horizon = self.horizon()
+        digest = self.kvs.digest
+        levels = digest.levels()
+        nodes = [[0, 0]]
+        differing_leaves = set()
+        while nodes:
+            try:
+                response = request(ip + "/kvs/gossip/digest", PUT, json={NODES: nodes})
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ):
+                return
+            if not status_code_success(response.status_code):
+                return
+            theirs = response.json().get(HASHES)
+            ours = digest.hashes(nodes, levels=levels)
+            next_nodes = []
+            for node, own_hash, their_hash in zip(nodes, ours, theirs):
+                if own_hash == their_hash:
+                    continue
+                if digest.is_leaf(node):
+                    differing_leaves.add(node[1])
+                else:
+                    next_nodes += digest.children(node, step=config.MERKLE_STEP)
+            nodes = next_nodes
+        # replica pulls what only it has on its own gossip round, horizons are sent even when in sync
+        json = {
+            KVS_TERM: (
+                self.kvs.json_leaves(differing_leaves) if differing_leaves else {}
+            ),
+            SENDER: self.view.address,
+            HORIZON: horizon,
+            REPLICA_HORIZON: replica_horizon,
+            SHARD_COUNTS: self._known_shard_counts(),
+        }
+        self._request_multiple_ips(
+            ips=[ip], url=url, method=PUT, json=json, deadline=GOSSIP_INTERVAL
+        )
 
     # Public Functions
 
+    @staticmethod
+    def valid_context(context: list) -> bool:
+        """Check if an untrusted causal context is a list of [key, context entry] pairs, each accepted
+        by KVSItem.valid_context
+
+        Args:
+            context (list)
+
+        Returns:
+            bool
+        """
+        return all(
+            isinstance(pair, list)
+            and len(pair) == 2
+            and isinstance(pair[0], str)
+            and KVSItem.valid_context(pair[1])
+            for pair in context
+        )
+
     def change_view(self, ips: list, repl_factor: int, propagate: bool = False) -> dict:
         """Public interface for a view change
 
+        Every node moves its own keys: keys now assigned to another bucket, or to a bucket gaining
+        replicas, are streamed in chunks directly to the replicas that need them, see _reshard.
+
         Args:
             ips (list): list of all IP addresses in new view
             repl_factor (int): replication factor of new view
@@ -257,95 +1058,336 @@ class KVSDistributor:
         Returns:
             dict: returned template, depending on propagation flag
         """
-        # set up default return as a node's shard
-        return_template = self.kvs.json()
-        # get all current + legacy ips as set to allow for dropped nodes
-        ips_union = [
-            ip for ip in list(set(ips + self.view.all_ips)) if ip != self.view.address
-        ]
-        # set new view -> new buckets
-        self.view = View(ips, self.view.address, repl_factor)
-        Scheduler.clear_jobs()
-        # init gossip again with new view, needed to force refresh scheduler underlying class
-        self._start_gossiping()
-        if propagate:
-            central_kvs = {}
-
-            # get all sub-kvs's (ie. shards) from each node
-            # note that there will be duplicate shards, but we do this
-            # to mitigate potential missed gossip between nodes in buckets
-            url = "/kvs/view-change-propagate"
-            json = {VIEW: ips, REPL_FACTOR: repl_factor}
-            shards = [
-                response.json().get(KVS_TERM)
-                for response, _ in self._request_multiple_ips(
-                    ips=ips_union, url=url, method=PUT, json=json
+        with self.view_lock:
+            old_view = self.view
+            # get all current + legacy ips as set to allow for dropped nodes
+            ips_union = [
+                ip for ip in list(set(ips + old_view.all_ips)) if ip != old_view.address
+            ]
+            # replicas which already hold the same keys as this node
+            old_bucket = (
+                old_view.self_replication_bucket()
+                if old_view.includes_own_address()
+                else [old_view.address]
+            )
+            # set new view -> new buckets and placement, swapped at once for requests in flight
+            self.view = View(ips, old_view.address, repl_factor)
+            self._reset_view_state()
+            Scheduler.clear_jobs()
+            # init gossip again with new view, needed to force refresh scheduler underlying class
+            self._start_gossiping()
+            self._start_persisting()
+            if propagate:
+                # each node reshards its own keys before responding
+                url = "/kvs/view-change-propagate"
+                json = {VIEW: ips, REPL_FACTOR: repl_factor}
+                self._request_multiple_ips(
+                    ips=ips_union,
+                    url=url,
+                    method=PUT,
+                    json=json,
+                    timeout=config.VIEW_CHANGE_TIMEOUT,
+                    deadline=config.VIEW_CHANGE_TIMEOUT,
                 )
-                if status_code_success(response.status_code)
+            moved = self._reshard(old_bucket)
+            if self.persistence:
+                # causal context was reset in place, which the log does not record
+                self.persistence.snapshot(self.kvs)
+            if not propagate:
+                return {KEYS_MOVED: moved}
+            # all nodes are done moving keys, collect resulting key counts
+            key_counts = [
+                self.key_count(bucket_index=index, cached=False)
+                for index in self.all_bucket_ids()
             ]
+            return self._generate_replica_template(key_counts)
+
+    def keys_moved(self, ips: list, repl_factor: int, propagate: bool = False) -> dict:
+        """Report how many keys a view change would move to a different set of replicas, without performing it
+
+        Args:
+            ips (list): list of all IP addresses in new view
+            repl_factor (int): replication factor of new view
+            propagate (bool, optional): should report cover every bucket instead of only own. Defaults to False.
+
+        Returns:
+            dict: key count and keys moved, either of own shard or per shard and in total. Totals
+                only cover shards which answered, shard IDs of the others are listed as unreachable.
+        """
+        view = self.view
+        if not propagate:
+            # same buckets as the view change would create
+            new_view = View(ips, view.address, repl_factor)
+            # keys move when their replicas change, whatever the index of their bucket
+            replicas = set(view.self_replication_bucket())
+            live_keys = [key for key, entry in self.kvs if not entry.is_deleted()]
+            moved = sum(
+                1
+                for key in live_keys
+                if set(new_view.buckets[new_view.placement.assign(key_hash(key))])
+                != replicas
+            )
+            return {
+                SHARD_ID: view.bucket_index,
+                KEY_COUNT: len(live_keys),
+                KEYS_MOVED: moved,
+            }
+
+        url = "/kvs/view-change/movement"
+        json = {VIEW: ips, REPL_FACTOR: repl_factor}
+        shards = []
+        unreachable = []
+        for index, bucket in enumerate(view.buckets):
+            if view.is_own_bucket_index(index):
+                shards.append(self.keys_moved(ips, repl_factor))
+                continue
+            # any replica of a bucket can report on the whole shard
+            response, _ = self._request_bucket(
+                bucket=bucket, url=url, method=PUT, json=json
+            )
+            if response != None and status_code_success(response.status_code):
+                shards.append(response.json())
+            else:
+                unreachable.append(index)
+        return {
+            KEY_COUNT: sum(shard[KEY_COUNT] for shard in shards),
+            KEYS_MOVED: sum(shard[KEYS_MOVED] for shard in shards),
+            "shards": shards,
+            UNREACHABLE: unreachable,
+        }
 
-            # include own shard
-            shards.append(self.kvs.json())
-            for shard in shards:
-                if isinstance(shard, dict):
-                    # use a mitigation function to combine all shards
-                    # this function will pick a more recent value in an identical key conflict
-                    central_kvs = KVS.combine_conflicting_shards(central_kvs, shard)
-            central_kvs = KVS.from_shard(central_kvs)
-            # remove contexts and delete needed keys
-            central_kvs.reset_context()
-            # assign new shard to each bucket
-            bucket_shards = self._shard_keys(central_kvs.json(include_deleted=False))
-            for shard, bucket in zip(bucket_shards, self.view.buckets):
-                # send each node in each bucket its shard
-                # prevents need for immediate gossip
-                url = "/kvs/shard"
-                json = {KVS_TERM: shard}
-                # if a node fails to get the shard, gossip will handle it
-                self._request_multiple_ips(ips=bucket, url=url, method=PUT, json=json)
-
-            # set own shard
-            if self.view.address in self.view.all_ips:
-                self.kvs = KVS.from_shard(bucket_shards[self.view.bucket_index])
-
-            # generate return template
-            return_template = self._generate_replica_template(bucket_shards)
-        return return_template
-
-    def merge_shard(self, shard: dict):
-        """Sets KVS to be a recieved shard
+    def merge_shard(self, shard: dict) -> int:
+        """Absorbs part of a shard sent by another node during a view change
+
+        Args:
+            shard (dict): key-value pairs, without causal context
+
+        Returns:
+            int: number of entries written
+        """
+        return self.kvs.merge(shard)
+
+    def merge_replicated(self, shard: dict):
+        """Absorbs writes replicated by another replica of the bucket, see _replicate_write
 
         Args:
             shard (dict): key-value pairs
         """
-        self.kvs = KVS.from_shard(shard)
-        # remove all context from shard, since context not persisted between views
-        self.kvs.reset_context()
+        self.kvs.merge(shard)
+
+    def entries(self, keys: list) -> dict:
+        """Get JSON serialized entries of own keys, including deleted ones, see _read_replicas
+
+        Args:
+            keys (list)
+
+        Returns:
+            dict: key -> entry, for keys present in KVS
+        """
+        entries = {}
+        for key in keys:
+            entry = self.kvs.get(key)
+            if entry:
+                entries[key] = entry.json()
+        return entries
 
-    def merge_gossip(self, shard: dict):
+    def merge_gossip(
+        self,
+        shard: dict,
+        sender: str = None,
+        horizon: int = None,
+        instance: str = None,
+        shard_counts: dict = None,
+        replica_horizon: int = None,
+    ):
         """Accepts gossip from replicas in same bucket
 
         Args:
             shard (dict): key-value structure
+            sender (str, optional): IP address of replica. Defaults to None.
+            horizon (int, optional): timestamp up to which all of sender's writes are now merged here. Defaults to None.
+            instance (str, optional): instance ID the gossip was computed for, None if it is the whole shard. Defaults to None.
+            shard_counts (dict, optional): key counts known to replica, see merge_shard_counts. Defaults to None.
+            replica_horizon (int, optional): timestamp up to which sender has every write of the bucket. Defaults to None.
+        """
+        self.kvs.merge(shard)
+        if shard_counts:
+            self.merge_shard_counts(shard_counts)
+        if sender and horizon and instance in (None, self.instance_id):
+            clock.update(horizon)
+            self.peer_horizons[sender] = max(self.peer_horizons.get(sender, 0), horizon)
+        if sender and replica_horizon != None:
+            self.replica_horizons[sender] = replica_horizon
+
+    def merge_shard_counts(self, shard_counts: dict):
+        """Absorb live key counts of buckets known to another node, keeping the most recent count of each
+
+        Args:
+            shard_counts (dict): bucket index -> [count, time.time() it was counted]
+        """
+        for index, (count, counted_at) in shard_counts.items():
+            index = int(index)
+            if self.view.is_own_bucket_index(index):
+                continue
+            _, known_at = self.shard_counts.get(index, (None, 0))
+            if counted_at > known_at:
+                self.shard_counts[index] = (count, counted_at)
+
+    def horizon(self) -> int:
+        """Timestamp up to which this node has every write of its bucket, from any replica
+
+        Returns:
+            int: 0 if node is not in view
         """
-        kvs_dict = self.kvs.json()
-        combined = KVS.combine_conflicting_shards(kvs_dict, shard)
-        self.kvs = KVS.from_shard(combined)
+        view = self.view
+        if not view.includes_own_address():
+            return 0
+        peers = view.self_replication_bucket(own_ip=False)
+        return min(
+            [self.kvs.horizon()] + [self.peer_horizons.get(ip, 0) for ip in peers]
+        )
+
+    def stable_horizon(self) -> int:
+        """Timestamp up to which every replica of the bucket has every write of the bucket
+
+        A deleted entry at or behind it is held, or overwritten, by all replicas, so no replica can
+        gossip an older value of its key back and purging it is safe.
+
+        Returns:
+            int: 0 if node is not in view
+        """
+        view = self.view
+        if not view.includes_own_address():
+            return 0
+        peers = view.self_replication_bucket(own_ip=False)
+        return min(
+            [self.horizon()] + [self.replica_horizons.get(ip, 0) for ip in peers]
+        )
+
+    def collect_tombstones(self) -> int:
+        """Purge deleted entries behind the stable horizon, so they no longer take memory or gossip
+
+        Returns:
+            int: number of entries purged
+        """
+        purged = self.kvs.purge_deleted(self.stable_horizon())
+        self.tombstones_purged += purged
+        return purged
+
+    def export_records(self):
+        """Stream own shard, including deleted entries, as newline delimited JSON records of [key, entry]
 
-    def key_count(self, bucket_index: int = None) -> int:
+        Yields:
+            bytes: STREAM_CHUNK_SIZE records at a time
+        """
+        chunk = []
+        for key, entry in self.kvs.stream():
+            chunk.append(record(key, entry.json()))
+            if len(chunk) >= config.STREAM_CHUNK_SIZE:
+                yield b"".join(chunk)
+                chunk = []
+        if chunk:
+            yield b"".join(chunk)
+
+    def import_records(self, lines) -> tuple:
+        """Merge records in the format of export_records into the buckets their keys are assigned to,
+        holding at most STREAM_CHUNK_SIZE entries per bucket in memory
+
+        Args:
+            lines (iterable): newline delimited JSON records, as bytes or str
+
+        Returns:
+            tuple: number of entries written, and error if a malformed record stopped the import
+                (records before it are imported, older versions than stored ones are not written)
+        """
+        view = self.view
+        chunks = [{} for bucket in view.buckets]
+        imported = 0
+        error = None
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                key, entry = json.loads(line)
+                # checked before merging, a malformed entry would break serializing the shard
+                if not isinstance(key, str) or not KVSItem.valid_json(entry):
+                    raise ValueError("Invalid entry")
+                bucket_index = view.key_bucket_index(key)
+            except (ValueError, TypeError):
+                error = f"Malformed record on line {line_number}"
+                break
+            chunk = chunks[bucket_index]
+            chunk[key] = entry
+            if len(chunk) >= config.STREAM_CHUNK_SIZE:
+                imported += self._import_chunk(bucket_index, chunk, view)
+                chunks[bucket_index] = {}
+        for bucket_index, chunk in enumerate(chunks):
+            if chunk:
+                imported += self._import_chunk(bucket_index, chunk, view)
+        return imported, error
+
+    def dependency_timestamps(self, keys: list) -> dict:
+        """Last write timestamps of keys, for another bucket checking causal dependencies
+
+        Args:
+            keys (list)
+
+        Returns:
+            dict: timestamps (key -> timestamp, None if key is missing) and node's horizon
+        """
+        return {
+            TIMESTAMPS: self.kvs.timestamps(keys),
+            HORIZON: self.horizon(),
+        }
+
+    def catch_up_shard(self, since: int) -> dict:
+        """Entries a restarting replica missed, see _catch_up
+
+        Args:
+            since (int): latest write timestamp the replica already has
+
+        Returns:
+            dict: JSON serialized shard
+        """
+        return self.kvs.json_after(since)
+
+    def digest_hashes(self, nodes: list) -> list:
+        """Hashes of the requested nodes of the KVS digest
+
+        Args:
+            nodes (list): [level, index] pairs, see MerkleTree
+
+        Returns:
+            list
+        """
+        return self.kvs.digest.hashes(nodes)
+
+    def key_count(self, bucket_index: int = None, cached: bool = True) -> int:
         """Returns number of keys in KVS
+
+        Own count is kept up to date by the KVS. Counts of other buckets are exchanged in the
+        background (see _send_key_counts) and used for KEY_COUNT_TTL seconds before asking the bucket.
+
         Args:
             bucket_index (int): shard ID for key count. Defaults to None (ie. own shard ID)
+            cached (bool, optional): may a count of another bucket be taken from cache. Defaults to True.
         Returns:
             int
         """
-        if bucket_index == None or bucket_index == self.view.bucket_index:
-            return len(self.kvs.json(include_deleted=False))
-        else:
-            url = "/kvs/key-count"
-            bucket = self.view.buckets[bucket_index]
-            responses = self._request_multiple_ips(ips=bucket, url=url, method=GET)
-            return key_count_max(responses)
+        view = self.view
+        if bucket_index == None or bucket_index == view.bucket_index:
+            return self.kvs.live
+        count, counted_at = self.shard_counts.get(bucket_index, (None, 0))
+        if cached and time.time() - counted_at <= config.KEY_COUNT_TTL:
+            return count
+        url = "/kvs/key-count"
+        bucket = view.buckets[bucket_index]
+        responses = self._request_multiple_ips(
+            ips=bucket, url=url, method=GET, deadline=config.REQUEST_DEADLINE
+        )
+        count = key_count_max(responses)
+        self.shard_counts[bucket_index] = (count, time.time())
+        return count
 
     def shard_id(self) -> int:
         """Return shard ID of own node
@@ -361,8 +1403,9 @@ class KVSDistributor:
         Returns:
             list: all IP addresses in node's bucket
         """
-        id = self.view.bucket_index if id == None else id
-        return self.view.buckets[id]
+        view = self.view
+        id = view.bucket_index if id == None else id
+        return view.buckets[id]
 
     def all_bucket_ids(self) -> list:
         """Return ID's of all buckets
@@ -372,28 +1415,48 @@ class KVSDistributor:
         """
         return [id for id, _ in enumerate(self.view.buckets)]
 
-    def get(self, key: str, context: list = []) -> GetResponse:
+    def get(
+        self,
+        key: str,
+        context: list = [],
+        consistency: str = None,
+        view: View = None,
+    ) -> GetResponse:
         """Public interface for completing GET requests
 
         Args:
             key (str)
             context (list, optional): causal context. Defaults to [].
                 ex. See _causal_context_ahead for structure of context
+            consistency (str, optional): ONE, QUORUM or ALL replicas to read. Defaults to None (READ_CONSISTENCY).
+            view (View, optional): view to serve request under. Defaults to None (current view).
 
         Returns:
             GetResponse
         """
-        bucket_index = self._assign_key_bucket(key)
-        if self.view.is_own_bucket_index(bucket_index):
+        view = view or self.view
+        consistency = consistency or config.READ_CONSISTENCY
+        context = compact_context(context)
+        self._observe_context(context)
+        bucket_index = view.key_bucket_index(key)
+        if view.is_own_bucket_index(bucket_index):
+            if not self._read_replicas(key, consistency, view):
+                return GetResponse(
+                    status_code=503,
+                    value=None,
+                    context=context,
+                    address=view.address,
+                    error=CONSISTENCY_UNREACHABLE,
+                )
             # given context is ahead of local KVS
             # check context first to allow for deleted keys to
             # be checked for causality errors
-            if self._causal_context_ahead(key, context):
+            if self._causal_context_ahead(key, view, context):
                 return GetResponse(
                     status_code=400,
                     value=None,
                     context=context,
-                    address=self.view.address,
+                    address=view.address,
                     error=UNABLE_TO_SATISFY,
                 )
             entry = self.kvs.get(key)
@@ -403,41 +1466,74 @@ class KVSDistributor:
                     status_code=404,
                     value=None,
                     context=context,
-                    address=self.view.address,
+                    address=view.address,
                     error=KEY_NOT_EXIST,
                 )
             # successful fetch
-            context.append([key, self.kvs.get(key).context()])
+            context = compact_context(context + [[key, self.kvs.get(key).context()]])
             return GetResponse(
                 status_code=200,
                 value=entry[VALUE],
                 context=context,
-                address=self.view.address,
+                address=view.address,
                 error=None,
                 message=GET_SUCCESS,
             )
         else:
+            if consistency == ONE:
+                cached = self._cached_read(key, context)
+                if cached:
+                    return cached
             # proxy request to another bucket
-            bucket = self.view.buckets[bucket_index]
+            bucket = view.buckets[bucket_index]
             url = f"/kvs/keys/{key}"
-            json = {CAUSAL_CONTEXT: context}
+            # node gathers the replicas' answers itself, each replica answers alone
+            json = {CAUSAL_CONTEXT: context, CONSISTENCY: ONE}
+            # a causal error is not an answer, another replica may have the value. At level ONE a
+            # 404 is not either, a lagging replica may not have the value yet: wait for a 200, or
+            # for every replica
+            counted = (200,) if consistency == ONE else (200, 404)
             responses = self._request_multiple_ips(
-                ips=bucket, url=url, method=GET, json=json
+                ips=bucket,
+                url=url,
+                method=GET,
+                json=json,
+                until=consistency,
+                accept=lambda r: r[0].status_code in counted,
+                deadline=config.REQUEST_DEADLINE,
             )
+            answers = [r for r in responses if r[0].status_code in (200, 404)]
+            if answers and len(answers) < required_responses(consistency, len(bucket)):
+                return GetResponse(
+                    status_code=503,
+                    value=None,
+                    context=context,
+                    address=view.address,
+                    error=CONSISTENCY_UNREACHABLE,
+                )
             if not len(responses):
                 # if entire bucket fails to respond, unlikely use case
                 return GetResponse(
                     status_code=503,
                     value=None,
                     context=context,
-                    address=self.view.address,
+                    address=view.address,
                     error=UNABLE_TO_SATISFY,
                 )
             # ensures that a 200 can be obtained even if not all replicas have a value yet
-            best_reponse, ip = get_request_most_recent(responses)
-            return GetResponse.from_flask_response(best_reponse, manual_address=ip)
+            best_reponse, ip = get_request_most_recent(answers or responses)
+            response = GetResponse.from_flask_response(best_reponse, manual_address=ip)
+            self._cache_proxied_version(key, response, value=response.value)
+            return self._remember_proxied_write(key, response)
 
-    def put(self, key: str, value: str = None, context: list = []) -> PutResponse:
+    def put(
+        self,
+        key: str,
+        value: str = None,
+        context: list = [],
+        consistency: str = None,
+        view: View = None,
+    ) -> PutResponse:
         """Public interface for completing PUT requests
 
         Args:
@@ -445,114 +1541,244 @@ class KVSDistributor:
             value (str)
             context (list, optional): causal context. Defaults to [].
                 ex. See _causal_context_ahead for structure of context
+            consistency (str, optional): ONE, QUORUM or ALL replicas to store write. Defaults to None (WRITE_CONSISTENCY).
+            view (View, optional): view to serve request under. Defaults to None (current view).
 
         Returns:
             PutResponse
         """
-        bucket_index = self._assign_key_bucket(key)
-        if self.view.is_own_bucket_index(bucket_index):
-            # key invalid
-            if not self._key_valid(key):
-                return PutResponse(
-                    status_code=400,
-                    error=KEY_TOO_LONG,
-                    address=self.view.address,
-                    context=context,
-                )
-            elif value == None:
-                # value missing
-                return PutResponse(
-                    status_code=400,
-                    error=VALUE_MISSING,
-                    address=self.view.address,
-                    context=context,
-                )
+        view = view or self.view
+        consistency = consistency or config.WRITE_CONSISTENCY
+        context = compact_context(context)
+        self._observe_context(context)
+        bucket_index = view.key_bucket_index(key)
+        if view.is_own_bucket_index(bucket_index):
+            invalid = self._invalid_put(key, value, context, view)
+            if invalid != None:
+                return invalid
             cause = self.kvs.create_cause_from_context(context)
-            inserted = self.kvs.upsert(key, value, cause)
-            context.append([key, self.kvs.get(key).context()])
-            if inserted:
-                return PutResponse(
-                    status_code=201,
-                    context=context,
-                    address=self.view.address,
-                    message=PUT_NEW_SUCCESS,
-                )
-            else:
-                return PutResponse(
-                    status_code=200,
-                    context=context,
-                    address=self.view.address,
-                    message=PUT_UPDATE_SUCCESS,
-                )
+            # committed together with concurrent PUTs
+            committed = self.put_commits.submit((key, value, cause, consistency))
+            return self._committed_put(key, committed, context, view)
         else:
             # proxy request to another bucket
-            bucket = self.view.buckets[bucket_index]
+            bucket = view.buckets[bucket_index]
             url = f"/kvs/keys/{key}"
-            json = {CAUSAL_CONTEXT: context, VALUE: value}
+            json = {CAUSAL_CONTEXT: context, VALUE: value, CONSISTENCY: consistency}
             proxy_response, ip = self._request_bucket(
                 bucket=bucket, url=url, method=PUT, json=json
             )
             if proxy_response != None:
-                return PutResponse.from_flask_response(
+                response = PutResponse.from_flask_response(
                     proxy_response, manual_address=ip
                 )
+                # read your writes without asking the bucket again
+                self._cache_proxied_version(key, response, value=value)
+                return self._remember_proxied_write(key, response)
             # if entire bucket fails to respond, unlikely use case
             return PutResponse(
                 status_code=503,
                 context=context,
-                address=self.view.address,
+                address=view.address,
                 error=UNABLE_TO_SATISFY,
             )
 
-    def delete(self, key: str, context: list = []):
+    def batch(self, operations: list, context: list = []) -> tuple:
+        """Public interface for completing a batch of GET, PUT and DELETE requests under one causal context
+
+        Operations are concurrent: each depends on the given context only, not on other operations
+        of the batch, so writes of a bulk load do not accumulate each other as causes. They are
+        grouped by bucket. Operations on own keys are applied in order, consecutive PUTs committed
+        together with one write-ahead log append and one replication request per replica (see
+        _commit_puts). Each other bucket is forwarded its operations as one sub-batch, all buckets
+        in parallel.
+
+        Args:
+            operations (list): dicts with op (GET, PUT or DELETE), key and, for PUT, value
+            context (list, optional): causal context. Defaults to [].
+
+        Returns:
+            tuple: result of each operation in order of operations (see _apply_operation), and
+                merged causal context following all operations
+        """
+        view = self.view
+        context = compact_context(context)
+        self._observe_context(context)
+        results = [None] * len(operations)
+        # bucket index -> [(position in batch, operation)]
+        groups = {}
+        for position, operation in enumerate(operations):
+            if (
+                not isinstance(operation, dict)
+                or operation.get(OPERATION) not in (GET, PUT, DELETE)
+                or not isinstance(operation.get(KEY), str)
+            ):
+                results[position] = {
+                    KEY: operation.get(KEY) if isinstance(operation, dict) else None,
+                    STATUS_CODE: 400,
+                    "message": "Error in batch",
+                    "error": INVALID_OPERATION,
+                }
+                continue
+            bucket_index = view.key_bucket_index(operation[KEY])
+            groups.setdefault(bucket_index, []).append((position, operation))
+
+        foreign = [
+            (bucket_index, group)
+            for bucket_index, group in groups.items()
+            if not view.is_own_bucket_index(bucket_index)
+        ]
+        tasks = [
+            # bind loop variables now, tasks run later
+            lambda bucket_index=bucket_index, group=group: (
+                group,
+                self._forward_batch(
+                    view.buckets[bucket_index], [op for _, op in group], context
+                ),
+            )
+            for bucket_index, group in foreign
+        ]
+        # foreign sub-batches run while own operations are applied
+        futures = [executor.submit(task) for task in tasks]
+
+        contexts = [context]
+        # consecutive own PUTs not yet committed, [(position in batch, key, value)]
+        puts = []
+
+        def commit_puts():
+            if not puts:
+                return
+            cause = self.kvs.create_cause_from_context(context)
+            committed = self._commit_puts(
+                [
+                    (key, value, cause, config.WRITE_CONSISTENCY)
+                    for _, key, value in puts
+                ]
+            )
+            for (position, key, _), write in zip(puts, committed):
+                response = self._committed_put(key, write, context, view)
+                results[position], operation_context = self._operation_result(
+                    key, response, context
+                )
+                contexts.append(operation_context)
+            puts.clear()
+
+        for position, operation in groups.get(view.bucket_index, []):
+            key = operation[KEY]
+            if operation[OPERATION] == PUT:
+                value = operation.get(VALUE)
+                invalid = self._invalid_put(key, value, context, view)
+                if invalid == None:
+                    puts.append((position, key, value))
+                else:
+                    results[position], _ = self._operation_result(key, invalid, context)
+                continue
+            # reads and deletes see the PUTs before them
+            commit_puts()
+            results[position], operation_context = self._apply_operation(
+                operation, context, view
+            )
+            contexts.append(operation_context)
+        commit_puts()
+
+        for future in futures:
+            try:
+                group, response = future.result()
+                if response == None or not status_code_success(response.status_code):
+                    continue
+                json = response.json()
+            except (requests.exceptions.RequestException, ValueError):
+                # operations of the sub-batch are answered 503 below
+                continue
+            for (position, _), result in zip(group, json.get(RESULTS, [])):
+                results[position] = result
+            sub_context = json.get(CAUSAL_CONTEXT) or []
+            contexts.append(sub_context)
+            keys = {operation[KEY] for _, operation in group}
+            for context_key, context_entry in sub_context:
+                if context_key in keys:
+                    self.remote_marks.update(context_key, context_entry.get(TIMESTAMP))
+
+        for position, result in enumerate(results):
+            if result == None:
+                # if entire bucket fails to respond, unlikely use case
+                results[position] = {
+                    KEY: operations[position][KEY],
+                    STATUS_CODE: 503,
+                    "message": "Error in batch",
+                    "error": UNABLE_TO_SATISFY,
+                }
+        return results, compact_context(sum(contexts, []))
+
+    def delete(
+        self,
+        key: str,
+        context: list = [],
+        consistency: str = None,
+        view: View = None,
+    ) -> DeleteResponse:
         """Public interface for completing DELETE requests
 
         Args:
             key (str)
             context (list, optional): causal context. Defaults to [].
                 ex. See _causal_context_ahead for structure of context
+            consistency (str, optional): ONE, QUORUM or ALL replicas to store delete. Defaults to None (WRITE_CONSISTENCY).
+            view (View, optional): view to serve request under. Defaults to None (current view).
 
         Returns:
             DeleteResponse
         """
-        bucket_index = self._assign_key_bucket(key)
-        if self.view.is_own_bucket_index(bucket_index):
-            item = self.kvs.get(key)
-            if not item or item.is_deleted():
+        view = view or self.view
+        consistency = consistency or config.WRITE_CONSISTENCY
+        context = compact_context(context)
+        self._observe_context(context)
+        bucket_index = view.key_bucket_index(key)
+        if view.is_own_bucket_index(bucket_index):
+            cause = self.kvs.create_cause_from_context(context)
+            # deletes are essentially write operations, update
+            # causal context when deleting a key
+            item = self.kvs.delete(key, cause)
+            if item == None:
                 return DeleteResponse(
                     status_code=404,
                     error=KEY_NOT_EXIST,
-                    address=self.view.address,
+                    address=view.address,
                     context=context,
                 )
             else:
-                cause = self.kvs.create_cause_from_context(context)
-                # deletes are essentially write operations, update
-                # causal context when deleting a key
-                item.delete(cause)
-                context.append([key, self.kvs.get(key).context()])
+                context = compact_context(context + [[key, item.context()]])
+                if not self._replicate_write(key, item, consistency, view):
+                    return DeleteResponse(
+                        status_code=503,
+                        error=CONSISTENCY_UNREACHABLE,
+                        address=view.address,
+                        context=context,
+                    )
                 return DeleteResponse(
                     status_code=200,
                     message=DELETE_SUCCESS,
-                    address=self.view.address,
+                    address=view.address,
                     context=context,
                 )
         else:
             # proxy request to another bucket
-            bucket = self.view.buckets[bucket_index]
+            bucket = view.buckets[bucket_index]
             url = f"/kvs/keys/{key}"
-            json = {CAUSAL_CONTEXT: context}
+            json = {CAUSAL_CONTEXT: context, CONSISTENCY: consistency}
             proxy_response, ip = self._request_bucket(
                 bucket=bucket, url=url, method=DELETE, json=json
             )
             if proxy_response != None:
-                return DeleteResponse.from_flask_response(
+                response = DeleteResponse.from_flask_response(
                     proxy_response, manual_address=ip
                 )
+                self._cache_proxied_version(key, response)
+                return self._remember_proxied_write(key, response)
             # if entire bucket fails to respond, unlikely use case
             return DeleteResponse(
                 status_code=503,
                 context=context,
-                address=self.view.address,
+                address=view.address,
                 error=UNABLE_TO_SATISFY,
-            )
\ No newline at end of file
+            )
@@ -0,0 +1,72 @@
+import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+import config
+from constants.terms import ONE, QUORUM, ALL
+
+executor = ThreadPoolExecutor(max_workers=config.FANOUT_WORKERS)
+
+
+def required_responses(level: str, total: int) -> int:
+    """Number of accepted responses needed to satisfy a level out of a number of requests
+
+    Args:
+        level (str | int): ONE, QUORUM, ALL or an exact number of responses
+        total (int)
+
+    Returns:
+        int
+    """
+    if isinstance(level, int):
+        return min(level, total)
+    elif level == ONE:
+        return min(1, total)
+    elif level == QUORUM:
+        return total // 2 + 1 if total else 0
+    return total
+
+
+def fan_out(
+    tasks: list,
+    until: str = ALL,
+    accept: callable = None,
+    deadline: float = None,
+) -> list:
+    """Run tasks concurrently on the shared thread pool, returning once enough of them succeed
+
+    Tasks raising a connection error or timeout are treated as having no result. Once enough results
+    are accepted, or the deadline passes, tasks which have not started are cancelled and tasks still
+    running are left to finish in the background with their results discarded.
+
+    Args:
+        tasks (list): callables taking no arguments
+        until (str | int, optional): ONE, QUORUM, ALL or a number of accepted results to wait for. Defaults to ALL.
+        accept (callable, optional): decides if a result counts towards `until`. Defaults to None (all results count).
+        deadline (float, optional): seconds to wait for results overall. Defaults to None (no deadline).
+
+    Returns:
+        list: results of finished tasks, in order of completion
+    """
+    needed = required_responses(until, len(tasks))
+    futures = [executor.submit(task) for task in tasks]
+    results = []
+    accepted = 0
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            try:
+                result = future.result()
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ):
+                continue
+            results.append(result)
+            if not accept or accept(result):
+                accepted += 1
+                if accepted >= needed:
+                    break
+    except TimeoutError:
+        pass
+    for future in futures:
+        future.cancel()
+    return results
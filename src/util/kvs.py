@@ -1,61 +1,82 @@
-import time
+import sys
+import json
+import threading
+from contextlib import ExitStack
+
+import config
 from util.misc import printer
+from util.merkle import MerkleTree
+from util.clock import clock
 from typing import NamedTuple
 from constants.terms import KEY, VALUE, TIMESTAMP, CAUSE, CONTEXT, DELETED
 
+# attribute storing each field of a KVSItem
+FIELDS = {VALUE: "value", TIMESTAMP: "timestamp", CAUSE: "cause", DELETED: "deleted"}
+# shared by every item without causal writes
+NO_CAUSE = ()
+
+
+def tie_break(is_deleted: bool, value) -> tuple:
+    """Order of writes with equal timestamps, issued by different nodes in the same millisecond,
+    so every replica keeps the same one
+
+    Args:
+        is_deleted (bool)
+        value: entry value, any JSON serializable value
+
+    Returns:
+        tuple: larger wins
+    """
+    if isinstance(value, str):
+        # common case, spared serializing
+        return bool(is_deleted), True, value
+    return bool(is_deleted), False, json.dumps(value, sort_keys=True)
+
 
 class KVSItem:
     """Data structure to represent item in KVS. Stores value and causal context
 
+    Items are slotted rather than carrying a __dict__, and items without causal writes share one
+    empty cause, to keep per-key overhead low.
+
     Args:
         value (str): entry value
-        last_write (float, optional): timestamp of last write of entry. Defaults to None.
+        last_write (int, optional): hybrid logical clock timestamp of last write of entry. Defaults to None (now).
         cause (list, optional): causal writes for a given entry. Defaults to None.
         is_deleted (bool, optional): indicates whether entry is deleted from public view of KVS. Defaults to False.
     """
 
+    __slots__ = ("value", "timestamp", "cause", "deleted", "seq")
+
     def __init__(
         self,
         value: str,
-        last_write: float = None,
+        last_write: int = None,
         cause: list = [],
         is_deleted: bool = False,
     ):
-        self[VALUE] = value
-        self[TIMESTAMP] = last_write or time.time()
-        self[CAUSE] = cause
-        self[DELETED] = is_deleted
+        self.value = value
+        self.timestamp = last_write or clock.now()
+        self.cause = cause or NO_CAUSE
+        self.deleted = is_deleted
+        # local write sequence number, assigned by owning KVS (never serialized)
+        self.seq = 0
 
     def __getitem__(self, key):
         """Allows bracket get of attribute"""
-        return getattr(self, key)
+        return getattr(self, FIELDS[key])
 
     def __setitem__(self, key, value):
         """Allows bracket set of attribute"""
-        return setattr(self, key, value)
+        return setattr(self, FIELDS[key], value)
 
-    def update(self, key: str, value: str, last_write: float = None, cause: list = []):
-        """Update an entry
+    def tie_break(self) -> tuple:
+        """Order of entry among writes with the same timestamp, see tie_break
 
-        Args:
-            key (str)
-            value (str)
-            last_write (float, optional) Defaults to None.
-            cause (list, optional): Defaults to [].
-        """
-        self[VALUE] = value
-        self[TIMESTAMP] = last_write or time.time()
-        self[CAUSE] = cause
-
-    def delete(self, cause: list = []):
-        """Delete entry from public view of KVS
-
-        Args:
-            cause (list, optional) Defaults to []
+        Returns:
+            tuple
         """
-        self[DELETED] = True
-        self[CAUSE] = cause
-        self[TIMESTAMP] = time.time()
+        return tie_break(self.deleted, self.value)
 
     def json(self) -> dict:
         """JSON serializable view of entry
@@ -64,10 +85,10 @@ class KVSItem:
             dict
         """
         return {
-            VALUE: self[VALUE],
-            TIMESTAMP: self[TIMESTAMP],
-            CAUSE: self[CAUSE],
-            DELETED: self[DELETED],
+            VALUE: self.value,
+            TIMESTAMP: self.timestamp,
+            CAUSE: list(self.cause),
+            DELETED: self.deleted,
         }
 
     def context(self) -> dict:
@@ -76,15 +97,19 @@ class KVSItem:
         Returns:
             dict
         """
-        return {TIMESTAMP: self[TIMESTAMP], CAUSE: self[CAUSE], DELETED: self[DELETED]}
+        return {
+            TIMESTAMP: self.timestamp,
+            CAUSE: list(self.cause),
+            DELETED: self.deleted,
+        }
 
-    def last_write(self) -> float:
+    def last_write(self) -> int:
         """Get last write timestamp of entry
 
         Returns:
-            float
+            int
         """
-        return self[TIMESTAMP]
+        return self.timestamp
 
     def is_deleted(self) -> bool:
         """Is entry visible in public KVS view.
@@ -92,18 +117,61 @@ class KVSItem:
         Returns:
             bool
         """
-        return self[DELETED]
+        return self.deleted
+
+    def without_context(self):
+        """Copy of entry without causal context. Last write timestamp is kept so replicas still agree on the latest write.
+
+        Returns:
+            KVSItem
+        """
+        return KVSItem(self.value, last_write=self.timestamp, is_deleted=self.deleted)
+
+    @staticmethod
+    def valid_context(json) -> bool:
+        """Check if an untrusted JSON context of an entry can be used: a last write timestamp accepted
+        by the clock, a cause of [key, timestamp] pairs and a boolean deleted flag, each optional
+
+        Args:
+            json: context in the format of KVSItem.context()
+
+        Returns:
+            bool
+        """
+
+        def integer(value) -> bool:
+            return isinstance(value, int) and not isinstance(value, bool)
+
+        return (
+            isinstance(json, dict)
+            and clock.valid(json.get(TIMESTAMP, 0))
+            and isinstance(json.get(CAUSE, []), list)
+            and all(
+                isinstance(pair, list)
+                and len(pair) == 2
+                and isinstance(pair[0], str)
+                and integer(pair[1])
+                for pair in json.get(CAUSE, [])
+            )
+            and isinstance(json.get(DELETED, False), bool)
+        )
 
-    def reset_context(self, timestamp: float = None):
-        """Remove all causal context from entry. Reset timestamp.
+    @staticmethod
+    def valid_json(json) -> bool:
+        """Check if an untrusted JSON entry can be stored: a value, and a context accepted by
+        valid_context
 
         Args:
-            timestamp (float, optional): manual new timestamp for entry. Defaults to None.
+            json: entry in the format of KVSItem.json()
+
+        Returns:
+            bool
         """
-        if not timestamp:
-            timestamp = time.time()
-        self[TIMESTAMP] = timestamp
-        self[CAUSE] = []
+        return (
+            isinstance(json, dict)
+            and json.get(VALUE) != None
+            and KVSItem.valid_context(json)
+        )
 
     @classmethod
     def from_json(cls, json: dict):
@@ -120,7 +188,7 @@ class KVSItem:
         """
         value, last_write, cause, is_deleted = (
             json.get(VALUE),
-            json.get(TIMESTAMP, time.time()),
+            json.get(TIMESTAMP) or clock.now(),
             json.get(CAUSE, []),
             json.get(DELETED, False),
         )
@@ -132,21 +200,115 @@ class KVSItem:
 
 
 class KVS:
-    """KVS data strucutre for storing key value pairs with causal context"""
+    """KVS data strucutre for storing key value pairs with causal context
+
+    Safe to use from multiple threads. Published KVSItems are never modified in place (writes store a
+    new item), so readers always see a consistent entry. A striped lock per key serializes each key's
+    read-modify-write, and a short structure lock guards the dict, sequence numbers and digest.
+    """
 
     def __init__(self):
+        # entries are kept in order of local modification (see _touch)
         self.kvs = {}
+        self.seq = 0
+        # digest of all entries, kept up to date on every modification
+        self.digest = MerkleTree()
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(config.KVS_LOCK_STRIPES)]
+        # write-ahead log receiving every modification, see util.persistence
+        self.log = None
+        # number of entries not deleted, kept up to date on every modification
+        self.live = 0
+        # timestamp up to which deleted entries were purged, see purge_deleted
+        self.purged_through = 0
 
     def __iter__(self):
-        """Allows using 'for ... in ...' on KVS"""
-        return iter(self.kvs.items())
+        """Allows using 'for ... in ...' on KVS. Iterates over a snapshot of entries."""
+        return iter(self._items())
 
     def __len__(self):
         return len(self.kvs)
 
+    def stream(self):
+        """Iterate over entries without copying them, holding only a snapshot of keys. Entries
+        modified meanwhile are yielded at their current version, removed ones are skipped.
+
+        Yields:
+            tuple: key, KVSItem
+        """
+        with self._lock:
+            keys = list(self.kvs)
+        for key in keys:
+            entry = self.kvs.get(key)
+            if entry is not None:
+                yield key, entry
+
+    def _items(self) -> list:
+        """Snapshot of all (key, entry) pairs, safe to iterate while KVS is modified
+
+        Returns:
+            list
+        """
+        with self._lock:
+            return list(self.kvs.items())
+
+    def _stripe(self, key: str) -> threading.Lock:
+        """Lock serializing writes to a key
+
+        Args:
+            key (str)
+
+        Returns:
+            threading.Lock
+        """
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def _touch(self, key: str, entry: KVSItem, stamp: bool = False):
+        """Store an entry as the most recently modified one, assigning it the next sequence number
+
+        Args:
+            key (str)
+            entry (KVSItem): new item, not yet stored
+            stamp (bool, optional): is entry a local write, to be timestamped now. Defaults to False.
+        """
+        with self._lock:
+            key = self._store(key, entry, stamp)
+            if self.log:
+                self.log.append(key, entry.json())
+
+    def _store(self, key: str, entry: KVSItem, stamp: bool = False) -> str:
+        """Store an entry without logging it, see _touch. Must hold structure lock.
+
+        Returns:
+            str: interned key
+        """
+        # keys are repeated in causes, contexts and gossip, share one copy
+        key = sys.intern(key)
+        if stamp:
+            # issued under lock, so a local write is stored before any larger timestamp is
+            # observed by horizon()
+            entry.timestamp = clock.now()
+        else:
+            clock.update(entry.timestamp)
+        self.seq += 1
+        entry.seq = self.seq
+        # re-insert so that dict order always matches sequence order
+        old = self.kvs.pop(key, None)
+        if old is not None:
+            self.digest.remove(key, old)
+            self.live -= not old.is_deleted()
+        self.kvs[key] = entry
+        self.digest.add(key, entry)
+        self.live += not entry.is_deleted()
+        return key
+
     def clear(self):
         """Reset KVS"""
-        self.kvs = {}
+        with self._lock:
+            self.kvs = {}
+            self.live = 0
+            self.purged_through = 0
+            self.digest.clear()
 
     def json(self, include_deleted=True) -> dict:
         """Return JSON serializable version of KVS
@@ -158,27 +320,163 @@ class KVS:
             dict
         """
         return (
-            {key: entry.json() for key, entry in self.kvs.items()}
+            {key: entry.json() for key, entry in self._items()}
             if include_deleted
             else {
                 key: entry.json()
-                for key, entry in self.kvs.items()
+                for key, entry in self._items()
                 if not entry.is_deleted()
             }
         )
 
-    def reset_context(self):
-        """Reset causal context for all entries in KVS. Delete any items with deleted flag set."""
-        timestamp = time.time()
-        to_delete = []
-        for key, entry in self.kvs.items():
-            if not entry.is_deleted():
-                entry.reset_context(timestamp=timestamp)
-            else:
-                to_delete.append(key)
-        for key in to_delete:
-            # safe delete from dict
-            self.kvs.pop(key, None)
+    def json_since(self, seq: int) -> tuple:
+        """Return JSON serializable version of entries modified after a sequence number
+
+        Walks entries from most to least recently modified, so cost is proportional to the delta.
+
+        Args:
+            seq (int): sequence number last acknowledged by the receiver
+
+        Returns:
+            tuple: JSON serializable entries, and horizon (see horizon) they were collected at
+        """
+        delta = {}
+        with self._lock:
+            horizon = clock.peek()
+            for key in reversed(self.kvs):
+                entry = self.kvs[key]
+                if entry.seq <= seq:
+                    break
+                delta[key] = entry
+        return {key: entry.json() for key, entry in delta.items()}, horizon
+
+    def horizon(self) -> int:
+        """Timestamp up to which every local write is stored. Local writes are timestamped while
+        holding the structure lock, so any later one is issued a larger timestamp.
+
+        Returns:
+            int
+        """
+        with self._lock:
+            return clock.peek()
+
+    def json_after(self, timestamp: int) -> dict:
+        """Return JSON serializable version of entries last written after a timestamp
+
+        Args:
+            timestamp (int)
+
+        Returns:
+            dict
+        """
+        return {
+            key: entry.json()
+            for key, entry in self._items()
+            if entry.last_write() > timestamp
+        }
+
+    def timestamps(self, keys: list) -> dict:
+        """Last write timestamps of keys, including deleted ones
+
+        Args:
+            keys (list)
+
+        Returns:
+            dict: key -> timestamp, None if key is missing
+        """
+        timestamps = {}
+        for key in keys:
+            entry = self.kvs.get(key)
+            timestamps[key] = entry.last_write() if entry else None
+        return timestamps
+
+    def latest_write(self) -> int:
+        """Timestamp of most recent write of any entry
+
+        Returns:
+            int: 0 if KVS is empty
+        """
+        return max((entry.last_write() for _, entry in self._items()), default=0)
+
+    def json_leaves(self, leaves: set) -> dict:
+        """Return JSON serializable version of entries falling in the given digest leaves
+
+        Args:
+            leaves (set): leaf indices, see MerkleTree.leaf_index
+
+        Returns:
+            dict
+        """
+        return {
+            key: entry.json()
+            for key, entry in self._items()
+            if self.digest.leaf_index(key) in leaves
+        }
+
+    def reset_context(self, purge_deleted: bool = True):
+        """Reset causal context for all entries in KVS. Delete any items with deleted flag set.
+
+        Args:
+            purge_deleted (bool, optional): should deleted items be removed. Defaults to True.
+        """
+        for key, entry in self._items():
+            with self._stripe(key):
+                # key may have been written again since the snapshot of items
+                if self.kvs.get(key) is not entry:
+                    continue
+                if purge_deleted and entry.is_deleted():
+                    self.remove(key)
+                elif entry.cause:
+                    # stored as a new item, logged so the reset survives a restart
+                    self._touch(key, entry.without_context())
+
+    def purge_deleted(self, horizon: int) -> int:
+        """Remove deleted entries last written at or before a timestamp. Deleted entries behind it
+        are no longer accepted by merge, so replicas yet to purge them cannot send them back.
+
+        Args:
+            horizon (int)
+
+        Returns:
+            int: number of entries removed
+        """
+        purged = 0
+        self.purged_through = max(self.purged_through, horizon)
+        for key, entry in self._items():
+            if not entry.is_deleted() or entry.last_write() > horizon:
+                continue
+            with self._stripe(key):
+                # key may have been written again since the snapshot of items
+                if self.kvs.get(key) is entry:
+                    self.remove(key)
+                    purged += 1
+        return purged
+
+    def remove(self, key: str):
+        """Remove entry from KVS entirely, without leaving a deleted entry behind
+
+        Args:
+            key (str)
+        """
+        with self._lock:
+            entry = self.kvs.pop(key, None)
+            if entry is not None:
+                self.digest.remove(key, entry)
+                self.live -= not entry.is_deleted()
+                if self.log:
+                    self.log.append(key)
+
+    def restore(self, key: str, entry: dict = None):
+        """Apply a persisted record to KVS unconditionally, see Persistence.load
+
+        Args:
+            key (str)
+            entry (dict, optional): JSON serialized KVSItem, None to remove key. Defaults to None.
+        """
+        if entry == None:
+            self.remove(key)
+        else:
+            self._touch(key, KVSItem.from_json(entry))
 
     def get(self, key, return_value=False):
         """Retrieve entry/value from KVS
@@ -206,17 +504,100 @@ class KVS:
         Returns:
             bool: was key inserted (ie. did not exist)
         """
-        entry = self.kvs.get(key)
-        inserted = not entry or entry.is_deleted()
-        self.kvs[key] = KVSItem(value, cause=cause)
+        with self._stripe(key):
+            entry = self.kvs.get(key)
+            inserted = not entry or entry.is_deleted()
+            self._touch(key, KVSItem(value, cause=cause), stamp=True)
         return inserted
 
+    def upsert_many(self, writes: list) -> list:
+        """Update or insert many entries at once, appending them to the write-ahead log in one write
+
+        Args:
+            writes (list): (key, value, cause) tuples, applied in order, see upsert
+
+        Returns:
+            list: (inserted, KVSItem stored) tuple for each write
+        """
+        results = []
+        with ExitStack() as stack:
+            # in index order, so concurrent callers cannot deadlock
+            for index in sorted(
+                {hash(key) % len(self._stripes) for key, _, _ in writes}
+            ):
+                stack.enter_context(self._stripes[index])
+            with self._lock:
+                records = []
+                for key, value, cause in writes:
+                    entry = self.kvs.get(key)
+                    inserted = not entry or entry.is_deleted()
+                    item = KVSItem(value, cause=cause)
+                    records.append((self._store(key, item, stamp=True), item.json()))
+                    results.append((inserted, item))
+                if self.log:
+                    self.log.append_many(records)
+        return results
+
+    def delete(self, key: str, cause: list = []) -> KVSItem:
+        """Delete entry from public view of KVS
+
+        Args:
+            key (str)
+            cause (list, optional): causal writes of delete. Defaults to [].
+
+        Returns:
+            KVSItem: deleted entry stored, None if key does not exist or is already deleted
+        """
+        with self._stripe(key):
+            entry = self.kvs.get(key)
+            if entry == None or entry.is_deleted():
+                return None
+            item = KVSItem(entry[VALUE], cause=cause, is_deleted=True)
+            self._touch(key, item, stamp=True)
+            return item
+
     def create_cause_from_context(self, context: list):
         return [[key, entry[TIMESTAMP]] for key, entry in context]
 
+    def merge(self, shard: dict) -> int:
+        """Merge a JSON serialized shard into KVS in place, keeping the most recent write of each key
+
+        Only entries that are new or strictly newer than the local one (ties broken by tie_break)
+        are written, so merging
+        identical state is a no-op, allocates nothing and does not mark entries as modified.
+        Deleted entries already purged (see purge_deleted) are not added back.
+
+        Args:
+            shard (dict)
+
+        Returns:
+            int: number of entries written
+        """
+        written = 0
+        for key, incoming in shard.items():
+            with self._stripe(key):
+                entry = self.kvs.get(key)
+                if entry is not None:
+                    timestamp = incoming.get(TIMESTAMP, 0)
+                    if timestamp < entry.last_write() or (
+                        timestamp == entry.last_write()
+                        and tie_break(incoming.get(DELETED, False), incoming.get(VALUE))
+                        <= entry.tie_break()
+                    ):
+                        continue
+                if (
+                    entry is None
+                    and incoming.get(DELETED, False)
+                    and incoming.get(TIMESTAMP, 0) <= self.purged_through
+                ):
+                    continue
+                self._touch(key, KVSItem.from_json(incoming))
+            written += 1
+        return written
+
     @classmethod
     def from_shard(cls, shard: dict):
-        """Create KVS from JSON serialized shard
+        """Create KVS from JSON serialized shard, used by scripts/stress_kvs.py and scripts/bench_merge.py
 
         Args:
             shard (dict)
@@ -226,13 +607,16 @@ class KVS:
         """
         instance = cls()
         for key, entry in shard.items():
-            instance.kvs[key] = KVSItem.from_json(entry)
+            instance._touch(key, KVSItem.from_json(entry))
         return instance
 
     @classmethod
     def combine_conflicting_shards(cls, shard_a: dict, shard_b: dict) -> dict:
         """Merges two shards (ie. dicts) which may have conflicting values for keys
 
+        No longer used by the distributor, which merges in place with merge. Kept only
+        as the round-trip baseline of scripts/bench_merge.py.
+
         Args:
             shard_a (dict): JSON serialized KVS
             shard_b (dict): JSON serialized KVS
@@ -0,0 +1,128 @@
+import mmh3
+
+import config
+
+
+class MerkleTree:
+    """Hash tree digest over KVS entries, bucketed into leaves by key hash range
+
+    Each leaf hash is the XOR of its entries' hashes, so it is maintained incrementally as entries
+    are added and removed instead of being rebuilt. Inner nodes combine their children the same way.
+    Nodes are addressed as [level, index], where level 0 is the root and level `depth` holds the leaves.
+
+    Args:
+        depth (int, optional): number of levels below the root (2 ** depth leaves). Defaults to config.MERKLE_DEPTH.
+    """
+
+    def __init__(self, depth: int = None):
+        self.depth = config.MERKLE_DEPTH if depth == None else depth
+        self.leaves = [0] * (1 << self.depth)
+
+    # Private Functions
+
+    @staticmethod
+    def _entry_hash(key: str, entry) -> int:
+        """Hash the parts of an entry that decide which replica's version wins a merge, including
+        the tie break between writes with equal timestamps
+
+        Args:
+            key (str)
+            entry (KVSItem)
+
+        Returns:
+            int
+        """
+        is_deleted, is_string, value = entry.tie_break()
+        return mmh3.hash64(
+            f"{key}|{entry.last_write()}|{is_deleted}|{is_string}|{value}",
+            signed=False,
+        )[0]
+
+    # Public Functions
+
+    def leaf_index(self, key: str) -> int:
+        """Leaf responsible for a key
+
+        Args:
+            key (str)
+
+        Returns:
+            int
+        """
+        return mmh3.hash(key, signed=False) >> (32 - self.depth)
+
+    def add(self, key: str, entry):
+        """Include an entry in the digest
+
+        Args:
+            key (str)
+            entry (KVSItem)
+        """
+        self.leaves[self.leaf_index(key)] ^= self._entry_hash(key, entry)
+
+    def remove(self, key: str, entry):
+        """Exclude a previously added entry from the digest
+
+        Args:
+            key (str)
+            entry (KVSItem)
+        """
+        # XOR is its own inverse
+        self.add(key, entry)
+
+    def clear(self):
+        """Reset digest to that of an empty KVS"""
+        self.leaves = [0] * (1 << self.depth)
+
+    def levels(self) -> list:
+        """Compute every level of the tree from the leaves up
+
+        Returns:
+            list: list of levels, each a list of node hashes. levels[0] is [root].
+        """
+        levels = [self.leaves]
+        while len(levels[0]) > 1:
+            below = levels[0]
+            levels.insert(
+                0,
+                [below[index] ^ below[index + 1] for index in range(0, len(below), 2)],
+            )
+        return levels
+
+    def hashes(self, nodes: list, levels: list = None) -> list:
+        """Hashes of the given nodes
+
+        Args:
+            nodes (list): [level, index] pairs
+            levels (list, optional): precomputed result of levels(). Defaults to None.
+
+        Returns:
+            list: hash of each node, in order
+        """
+        levels = levels or self.levels()
+        return [levels[level][index] for level, index in nodes]
+
+    def children(self, node: list, step: int = 1) -> list:
+        """Descendants of a node a number of levels further down, capped at the leaves
+
+        Args:
+            node (list): [level, index]
+            step (int, optional): levels to descend. Defaults to 1.
+
+        Returns:
+            list: [level, index] pairs
+        """
+        level, index = node
+        step = min(step, self.depth - level)
+        return [[level + step, (index << step) + offset] for offset in range(1 << step)]
+
+    def is_leaf(self, node: list) -> bool:
+        """Is node at the bottom level
+
+        Args:
+            node (list): [level, index]
+
+        Returns:
+            bool
+        """
+        return node[0] == self.depth
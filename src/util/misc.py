@@ -1,7 +1,17 @@
 import sys
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError, MaxRetryError
+
+import config
 from constants.terms import *
 
+# one pooled keep-alive session per peer, host -> requests.Session
+sessions = {}
+sessions_lock = threading.Lock()
+
 
 def printer(msg: str):
     """Used to print in Flask debug settings. Flushed stdout to allow printing.
@@ -12,11 +22,93 @@ def printer(msg: str):
     print(msg, file=sys.stdout, flush=True)
 
 
+class RefusedConnectionRetry(Retry):
+    """Retry policy retrying refused connections only. A peer not answering a connection attempt at
+    all (down or partitioned) would only time out again, so it fails after one connect timeout.
+    """
+
+    def increment(
+        self,
+        method=None,
+        url=None,
+        response=None,
+        error=None,
+        _pool=None,
+        _stacktrace=None,
+    ):
+        if isinstance(error, ConnectTimeoutError) and not isinstance(
+            error, NewConnectionError
+        ):
+            raise MaxRetryError(_pool, url, error)
+        return super().increment(
+            method, url, response, error, _pool=_pool, _stacktrace=_stacktrace
+        )
+
+
+def session(host: str) -> requests.Session:
+    """Get the pooled session used for all requests to a peer, creating it on first use
+
+    Only refused connections are retried, since a request which reached the peer may not be safe to
+    repeat, and a peer not answering would only time out again.
+
+    Args:
+        host (str): IP address and port of peer
+
+    Returns:
+        requests.Session
+    """
+    with sessions_lock:
+        if host not in sessions:
+            retry = RefusedConnectionRetry(
+                total=config.REQUEST_RETRIES,
+                connect=config.REQUEST_RETRIES,
+                read=0,
+                status=0,
+                other=0,
+                backoff_factor=config.REQUEST_BACKOFF,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=config.POOL_MAXSIZE, max_retries=retry
+            )
+            peer_session = requests.Session()
+            peer_session.mount("http://", adapter)
+            sessions[host] = peer_session
+        return sessions[host]
+
+
+def connection_stats() -> dict:
+    """Connection reuse counters of every peer's pool
+
+    A request is a hit if it reused a kept-alive connection, and a miss if it had to open a new one.
+
+    Returns:
+        dict: host -> {requests, hits, misses}
+    """
+    stats = {}
+    with sessions_lock:
+        peers = list(sessions.items())
+    for host, peer_session in peers:
+        pools = peer_session.get_adapter("http://").poolmanager.pools
+        num_requests = num_connections = 0
+        for pool_key in pools.keys():
+            pool = pools.get(pool_key)
+            if pool:
+                num_requests += pool.num_requests
+                num_connections += pool.num_connections
+        stats[host] = {
+            "requests": num_requests,
+            "hits": num_requests - num_connections,
+            "misses": num_connections,
+        }
+    return stats
+
+
 def request(
     url: str,
     method: str = GET,
     headers: dict = {},
     json: dict = {},
+    timeout: float = None,
 ) -> requests.Response:
     """Standard requests library wrapper
 
@@ -25,14 +117,20 @@ def request(
         method (str, optional). Defaults to "GET".
         headers (dict, optional). Defaults to {}.
         json (dict, optional). Defaults to {}.
+        timeout (float, optional): seconds to wait for a response once connected. Defaults to None (3 seconds).
 
     Returns:
         requests.Response
     """
+    host = url.split("/", 1)[0]
     url = "http://" + url
     headers.update({"Content-Type": "application/json"})
-    return requests.request(
-        method=method, url=url, headers=headers, json=json, timeout=3
+    return session(host).request(
+        method=method,
+        url=url,
+        headers=headers,
+        json=json,
+        timeout=(config.REQUEST_CONNECT_TIMEOUT, timeout or 3),
     )
 
 
@@ -83,6 +181,48 @@ def get_request_most_recent(responses: list) -> tuple:
         return sort_by_min_status[0]
 
 
+def compact_cause(cause: list) -> list:
+    """Collapse causal writes to the latest timestamp of each key
+
+    Args:
+        cause (list): [key, timestamp] pairs
+
+    Returns:
+        list: [key, timestamp] pairs, one per key
+    """
+    latest = {}
+    for key, timestamp in cause:
+        if key not in latest or timestamp > latest[key]:
+            latest[key] = timestamp
+    return [[key, timestamp] for key, timestamp in latest.items()]
+
+
+def compact_context(context: list) -> list:
+    """Collapse causal context to one entry per key, so its size is bounded by the number of keys a
+    session touched rather than its number of requests
+
+    The latest entry of each key is kept, carrying the causes of the entries it replaces, and is
+    ordered by the key's last appearance, so the entry of the key read last stays last.
+
+    Args:
+        context (list): causal context, see KVSDistributor._causal_context_ahead
+
+    Returns:
+        list: compacted causal context
+    """
+    latest = {}
+    for key, entry in context:
+        previous = latest.pop(key, None)
+        if previous != None:
+            older, entry = sorted([previous, entry], key=lambda e: e.get(TIMESTAMP, 0))
+            entry = {**entry, CAUSE: entry.get(CAUSE, []) + older.get(CAUSE, [])}
+        latest[key] = entry
+    return [
+        [key, {**entry, CAUSE: compact_cause(entry.get(CAUSE, []))}]
+        for key, entry in latest.items()
+    ]
+
+
 def key_count_max(responses: list) -> int:
     """Allows for fetching the maximum key count in a set of responses (to mitigate gossip lag)
 
@@ -98,4 +238,4 @@ def key_count_max(responses: list) -> int:
         if json.get(KEY_COUNT):
             max_count = max(max_count, int(json.get(KEY_COUNT)))
 
-    return max_count
\ No newline at end of file
+    return max_count
@@ -0,0 +1,224 @@
+import os
+import json
+import mmap
+import time
+import uuid
+import threading
+
+import config
+from util.misc import printer
+from constants.terms import FSYNC_ALWAYS, FSYNC_BATCHED, FSYNC_PERIODIC
+
+SNAPSHOT_FILE = "snapshot.ndjson"
+# ID of the process whose state is persisted, kept across restarts
+INSTANCE_FILE = "instance"
+LOG_FILE = "wal.ndjson"
+# log being compacted into a snapshot, replayed if a snapshot was interrupted
+ROTATED_LOG_FILE = "wal.ndjson.old"
+
+
+def record(key: str, entry: dict = None) -> bytes:
+    """Serialize a single log, snapshot or export record
+
+    Args:
+        key (str)
+        entry (dict, optional): JSON serialized KVSItem, None for a removed key. Defaults to None.
+
+    Returns:
+        bytes: one newline terminated JSON line
+    """
+    return (json.dumps([key, entry], separators=(",", ":")) + "\n").encode()
+
+
+def _read_records(path: str):
+    """Yield (key, entry) records of a file written by Persistence, memory mapping it instead of
+    reading it into memory. A torn final record left by a crash mid-write is truncated away, so
+    records appended afterwards stay readable.
+
+    Args:
+        path (str)
+
+    Yields:
+        tuple: key and JSON serialized KVSItem, or None for a removed key
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    torn = None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        while True:
+            start = mm.tell()
+            line = mm.readline()
+            if not line:
+                break
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("record not terminated")
+                key, entry = json.loads(line)
+            except ValueError:
+                torn = start
+                break
+            yield key, entry
+    if torn != None:
+        printer(f"Truncating torn record at end of {path}")
+        os.truncate(path, torn)
+
+
+class Persistence:
+    """Durable storage of a KVS as an append-only write-ahead log of modifications, periodically
+    compacted into a snapshot of all entries
+
+    Args:
+        directory (str): directory holding snapshot and log files
+        fsync_policy (str, optional): "always" syncs every record, "batch" every batch_size records,
+            "interval" at most every interval seconds. Defaults to config.FSYNC_POLICY.
+        batch_size (int, optional): records per sync under "batch" policy. Defaults to config.FSYNC_BATCH_SIZE.
+        interval (float, optional): seconds between syncs under "interval" policy. Defaults to config.FSYNC_INTERVAL.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        fsync_policy: str = config.FSYNC_POLICY,
+        batch_size: int = config.FSYNC_BATCH_SIZE,
+        interval: float = config.FSYNC_INTERVAL,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync_policy = fsync_policy
+        self.batch_size = batch_size
+        self.interval = interval
+        # records appended since last sync
+        self.unsynced = 0
+        self.last_sync = time.time()
+        # serializes appends, syncs and log rotation
+        self.lock = threading.Lock()
+        # only one snapshot at a time
+        self.snapshot_lock = threading.Lock()
+        self.log = self._open_log()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _open_log(self):
+        """Open log for appending. Unbuffered, so records reach the OS immediately and survive a
+        process crash whatever the fsync policy, which only decides when they survive a machine crash.
+        """
+        return open(self._path(LOG_FILE), "ab", buffering=0)
+
+    def _sync(self):
+        """Fsync log. Must hold lock."""
+        os.fsync(self.log.fileno())
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    # Public Functions
+
+    def append(self, key: str, entry: dict = None):
+        """Append a modification of a key to the log, syncing according to fsync policy
+
+        Args:
+            key (str)
+            entry (dict, optional): JSON serialized KVSItem, None if key was removed. Defaults to None.
+        """
+        self.append_many([(key, entry)])
+
+    def append_many(self, records: list):
+        """Append modifications of many keys to the log in a single write, syncing at most once
+
+        Args:
+            records (list): (key, entry) tuples, see append
+        """
+        lines = b"".join(record(key, entry) for key, entry in records)
+        with self.lock:
+            self.log.write(lines)
+            self.unsynced += len(records)
+            if (
+                self.fsync_policy == FSYNC_ALWAYS
+                or (
+                    self.fsync_policy == FSYNC_BATCHED
+                    and self.unsynced >= self.batch_size
+                )
+                or (
+                    self.fsync_policy == FSYNC_PERIODIC
+                    and time.time() - self.last_sync >= self.interval
+                )
+            ):
+                self._sync()
+
+    def sync(self):
+        """Sync any records not yet on disk, covering idle periods of batched and interval policies"""
+        with self.lock:
+            if self.unsynced:
+                self._sync()
+
+    def snapshot(self, kvs):
+        """Write all entries of KVS to a new snapshot and discard log records it covers
+
+        The log is rotated before entries are collected, so every modification is either in the
+        snapshot or in the new log. Records in both are replayed in order and yield the same entry.
+
+        Args:
+            kvs (KVS)
+        """
+        with self.snapshot_lock:
+            with self.lock:
+                self._sync()
+                self.log.close()
+                rotated = self._path(ROTATED_LOG_FILE)
+                if not os.path.exists(rotated):
+                    # otherwise keep log of an interrupted snapshot, it is covered by this one
+                    os.replace(self._path(LOG_FILE), rotated)
+                else:
+                    with open(rotated, "ab") as old, open(
+                        self._path(LOG_FILE), "rb"
+                    ) as current:
+                        old.write(current.read())
+                    os.remove(self._path(LOG_FILE))
+                self.log = self._open_log()
+            temp = self._path(SNAPSHOT_FILE + ".tmp")
+            with open(temp, "wb") as f:
+                for key, entry in kvs:
+                    f.write(record(key, entry.json()))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self._path(SNAPSHOT_FILE))
+            os.remove(rotated)
+
+    def instance_id(self) -> str:
+        """ID of the node whose state is persisted, generated on first use
+
+        Peers track gossip acknowledged per instance ID, so keeping it across restarts spares a
+        recovered node being sent its entire shard again.
+
+        Returns:
+            str
+        """
+        path = self._path(INSTANCE_FILE)
+        if not os.path.exists(path):
+            with open(path + ".tmp", "w") as f:
+                f.write(uuid.uuid4().hex)
+            os.replace(path + ".tmp", path)
+        with open(path) as f:
+            return f.read().strip()
+
+    def load(self, kvs) -> int:
+        """Restore KVS from snapshot followed by log records written after it
+
+        Args:
+            kvs (KVS): empty KVS to restore into
+
+        Returns:
+            int: number of records applied
+        """
+        applied = 0
+        for name in (SNAPSHOT_FILE, ROTATED_LOG_FILE, LOG_FILE):
+            for key, entry in _read_records(self._path(name)):
+                kvs.restore(key, entry)
+                applied += 1
+        return applied
+
+    def close(self):
+        """Sync and close log"""
+        with self.lock:
+            self._sync()
+            self.log.close()
@@ -0,0 +1,106 @@
+import bisect
+import mmh3
+
+import config
+from constants.terms import PLACEMENT_RING
+
+HASH_SPACE = float(2**128)
+
+
+def key_hash(key: str) -> int:
+    """Position of a key in the 128 bit Murmurhash space
+
+    Args:
+        key (str)
+
+    Returns:
+        int
+    """
+    return mmh3.hash128(key, signed=False)
+
+
+class RangePlacement:
+    """Assigns keys to buckets by splitting the hash space into equal contiguous ranges
+
+    Args:
+        num_buckets (int)
+    """
+
+    def __init__(self, num_buckets: int):
+        self.num_buckets = num_buckets
+
+    def assign(self, hashed: int) -> int:
+        """Bucket responsible for a hashed key
+
+        Placement is identical to scanning every bucket for i / n <= p < (i + 1) / n with float
+        arithmetic: the index is computed directly, then nudged to absorb float rounding at range edges.
+
+        Args:
+            hashed (int): see key_hash
+
+        Returns:
+            int: bucket index
+        """
+        num_buckets = float(self.num_buckets)
+        p = hashed / HASH_SPACE
+        index = min(int(p * num_buckets), self.num_buckets - 1)
+        while index > 0 and index / num_buckets > p:
+            index -= 1
+        while index < self.num_buckets - 1 and (index + 1) / num_buckets <= p:
+            index += 1
+        return index
+
+
+class RingPlacement:
+    """Assigns keys to buckets with a consistent hashing ring of virtual nodes
+
+    Each bucket owns a number of points on the ring and a key belongs to the bucket owning the first
+    point at or after the key's hash. Points are hashed from the bucket's IP addresses rather than
+    its index, so a bucket keeps its points when others are added or removed, and only the keys
+    adjacent to the points of added or removed buckets move, about 1 / num_buckets of all keys.
+
+    Buckets are contiguous slices of the view, so with a replication factor above 1 removing a node
+    regroups the buckets after it. Their points change too, and their keys move.
+
+    Args:
+        buckets (list): IP addresses of each bucket
+        vnodes (int, optional): points per bucket. Defaults to config.RING_VNODES.
+    """
+
+    def __init__(self, buckets: list, vnodes: int = None):
+        self.num_buckets = len(buckets)
+        self.vnodes = config.RING_VNODES if vnodes == None else vnodes
+        ring = sorted(
+            (key_hash(f"{','.join(sorted(bucket))}-{vnode}"), bucket_index)
+            for bucket_index, bucket in enumerate(buckets)
+            for vnode in range(self.vnodes)
+        )
+        self.points = [point for point, _ in ring]
+        self.owners = [bucket_index for _, bucket_index in ring]
+
+    def assign(self, hashed: int) -> int:
+        """Bucket responsible for a hashed key
+
+        Args:
+            hashed (int): see key_hash
+
+        Returns:
+            int: bucket index
+        """
+        position = bisect.bisect_left(self.points, hashed)
+        # wrap around past the last point
+        return self.owners[position % len(self.owners)]
+
+
+def create_placement(buckets: list):
+    """Create the placement strategy configured for this deployment
+
+    Args:
+        buckets (list): IP addresses of each bucket of the view
+
+    Returns:
+        RangePlacement or RingPlacement
+    """
+    if config.PLACEMENT == PLACEMENT_RING:
+        return RingPlacement(buckets)
+    return RangePlacement(len(buckets))
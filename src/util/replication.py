@@ -0,0 +1,106 @@
+import time
+import threading
+import requests
+
+from util.misc import request, status_code_success
+from util.fanout import executor
+from constants.terms import KVS_TERM, PUT
+
+
+class Replicator:
+    """Pushes writes to the other replicas of a bucket within milliseconds, instead of leaving them
+    to the next gossip round
+
+    Writes are queued per replica and sent every interval seconds, one request per replica holding
+    the latest entry of each key written since. A replica is sent its next batch only once the
+    previous one was answered, so writes to a slow replica coalesce instead of piling up. Batches
+    that fail are dropped, gossip delivers them later.
+
+    Args:
+        interval (float): seconds between pushes
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        # replica IP -> {key: JSON serialized entry} waiting to be pushed
+        self.pending = {}
+        # replicas with a batch in flight
+        self.sending = set()
+        self.batches = 0
+        self.entries = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def _send(self, ip: str, batch: dict):
+        """Push a batch to a replica, see flush"""
+        try:
+            response = request(ip + "/kvs/replicate", PUT, {}, {KVS_TERM: batch})
+            sent = status_code_success(response.status_code)
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+        ):
+            sent = False
+        with self.lock:
+            self.sending.discard(ip)
+            if sent:
+                self.batches += 1
+                self.entries += len(batch)
+            else:
+                self.failures += 1
+
+    # Public Functions
+
+    def set_replicas(self, ips: list):
+        """Replace the replicas writes are pushed to, keeping writes queued for those remaining
+
+        Args:
+            ips (list): IP addresses of other replicas of node's bucket
+        """
+        with self.lock:
+            self.pending = {ip: self.pending.get(ip, {}) for ip in ips}
+
+    def push(self, key: str, entry: dict):
+        """Queue a write for every replica
+
+        Args:
+            key (str)
+            entry (dict): JSON serialized KVSItem
+        """
+        with self.lock:
+            for batch in self.pending.values():
+                batch[key] = entry
+
+    def flush(self):
+        """Send every replica without a batch in flight the writes queued for it"""
+        with self.lock:
+            batches = {
+                ip: batch
+                for ip, batch in self.pending.items()
+                if batch and ip not in self.sending
+            }
+            for ip in batches:
+                self.pending[ip] = {}
+                self.sending.add(ip)
+        for ip, batch in batches.items():
+            executor.submit(self._send, ip, batch)
+
+    def stats(self) -> dict:
+        """Push counters
+
+        Returns:
+            dict
+        """
+        with self.lock:
+            return {
+                "batches": self.batches,
+                "entries": self.entries,
+                "failures": self.failures,
+                "queued": sum(len(batch) for batch in self.pending.values()),
+            }
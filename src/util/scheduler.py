@@ -56,8 +56,7 @@ class Scheduler:
 
         # remove job first if ID already associated
         if id in cls.jobs:
-            cls[jobs][id].remove()
-            del cls[jobs][id]
+            cls.remove_job(id)
 
         def job_wrapper():
             return_value = function(*args)
@@ -73,6 +72,17 @@ class Scheduler:
         cls.jobs[id] = job
         return id
 
+    @classmethod
+    def remove_job(cls, id: str):
+        """Delete a job, if present
+
+        Args:
+            id (str): job ID
+        """
+        job = cls.jobs.pop(id, None)
+        if job:
+            job.remove()
+
     @classmethod
     def clear_jobs(cls):
         """Delete all jobs"""
@@ -1,10 +1,45 @@
+import config
+from util.placement import create_placement, key_hash
+
+
 class View:
+    """Buckets of a view, and the placement assigning keys to them
+
+    Never modified once created (besides memoizing key assignments), so a view change replaces the
+    whole view at once and a request reading it once sees buckets and placement agree.
+    """
+
     def __init__(self, ips: list, address: str, repl_factor: int):
         self.all_ips = ips
         self.address = address
         self.repl_factor = repl_factor
         self._test_class_inputs_valid()
         self._create_buckets()
+        self.placement = create_placement(self.buckets)
+        # memoized key -> bucket index assignments under placement
+        self.key_buckets = {}
+
+    @staticmethod
+    def valid(ips, repl_factor) -> bool:
+        """Check if untrusted inputs make a valid view: a non-empty list of IP addresses split evenly
+        into buckets by a positive integer replication factor
+
+        Args:
+            ips: IP addresses of view
+            repl_factor: replication factor of view
+
+        Returns:
+            bool
+        """
+        return (
+            isinstance(ips, list)
+            and len(ips) > 0
+            and all(isinstance(ip, str) for ip in ips)
+            and isinstance(repl_factor, int)
+            and not isinstance(repl_factor, bool)
+            and repl_factor > 0
+            and len(ips) % repl_factor == 0
+        )
 
     def _test_class_inputs_valid(self):
         """Validates view inputs"""
@@ -22,11 +57,30 @@ class View:
             self.all_ips[x : x + self.repl_factor]
             for x in range(0, len(self.all_ips), self.repl_factor)
         ]
+        # node may not be part of the view
+        self.bucket_index = None
         for index, bucket in enumerate(self.buckets):
             if self.address in bucket:
                 self.bucket_index = index
                 break
 
+    def key_bucket_index(self, key: str) -> int:
+        """Determines which replica bucket is assigned a key based on the view's placement and Murmurhash
+
+        Args:
+            key (str)
+
+        Returns:
+            int: index in buckets
+        """
+        bucket_index = self.key_buckets.get(key)
+        if bucket_index == None:
+            bucket_index = self.placement.assign(key_hash(key))
+            if len(self.key_buckets) >= config.KEY_BUCKET_CACHE_SIZE:
+                self.key_buckets.clear()
+            self.key_buckets[key] = bucket_index
+        return bucket_index
+
     def num_buckets(self) -> int:
         """Returns number of replica buckets
 